@@ -0,0 +1,217 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks for the contact form hot path.
+
+Run from the repository root::
+
+    python -m benchmarks.run
+    python -m benchmarks.run --smtp --runs 10 post send
+
+Each benchmark is run ``--loops`` times per run, for ``--runs`` runs after
+a warmup. The report shows the mean time per operation with its standard
+deviation, operations per second and (on Python 3) the peak amount of
+memory allocated while running the benchmark.
+"""
+
+from __future__ import division, print_function, unicode_literals
+
+import argparse
+import gc
+import math
+import os
+import sys
+import time
+
+try:
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+import django
+
+
+timer = getattr(time, 'perf_counter', time.time)
+
+FORM_DATA = {
+    'sender': 'zbyszek',
+    'email': 'test@example.com',
+    'subject': 'A subject',
+    'message': 'Hello there!\n' * 20,
+    'email2': '',
+}
+
+BENCHMARKS = []
+
+
+def benchmark(func):
+    """
+    Registers a benchmark. The function prepares the benchmark and returns
+    a callable which runs a single operation.
+    """
+    BENCHMARKS.append(func)
+    return func
+
+
+@benchmark
+def validation():
+    from envelope.forms import ContactForm
+    return lambda: ContactForm(FORM_DATA).is_valid()
+
+
+@benchmark
+def spam_filters():
+    from django.test import RequestFactory
+    from envelope.forms import ContactForm
+    from envelope.spam_filters import get_spam_filter_pipeline
+    request = RequestFactory().post('/', FORM_DATA)
+    form = ContactForm(FORM_DATA)
+    form.is_valid()
+    pipeline = get_spam_filter_pipeline()
+    return lambda: pipeline.run(request, form)
+
+
+@benchmark
+def rendering():
+    from envelope.forms import ContactForm
+    form = ContactForm(FORM_DATA)
+    form.is_valid()
+    return form.get_message
+
+
+@benchmark
+def send():
+    from django.core import mail
+    from envelope.delivery import get_delivery_backend
+    from envelope.forms import ContactForm
+    form = ContactForm(FORM_DATA)
+    form.is_valid()
+    message = form.get_message()
+    backend = get_delivery_backend()
+
+    def run():
+        mail.outbox = []
+        backend.deliver(message, form)
+    return run
+
+
+@benchmark
+def render_contact_form():
+    from django.template import Context, Template
+    from envelope.forms import ContactForm
+    template = Template('{% load envelope_tags %}{% render_contact_form %}')
+    return lambda: template.render(Context({'form': ContactForm()}))
+
+
+@benchmark
+def get():
+    from django.test import Client
+    client = Client()
+    return lambda: client.get('/')
+
+
+@benchmark
+def post():
+    from django.core import mail
+    from django.test import Client
+    client = Client()
+
+    def run():
+        mail.outbox = []
+        client.post('/', FORM_DATA)
+    return run
+
+
+def measure(func, loops, runs, warmups=1):
+    """
+    Returns a list of mean times per operation, one for each run.
+    """
+    for i in range(warmups * loops):
+        func()
+    samples = []
+    for i in range(runs):
+        gc.collect()
+        start = timer()
+        for j in range(loops):
+            func()
+        samples.append((timer() - start) / loops)
+    return samples
+
+
+def measure_memory(func, loops):
+    """
+    Returns the peak number of bytes allocated while running the function.
+    """
+    if tracemalloc is None:
+        return None
+    gc.collect()
+    tracemalloc.start()
+    try:
+        baseline = tracemalloc.get_traced_memory()[0]
+        for i in range(loops):
+            func()
+        return tracemalloc.get_traced_memory()[1] - baseline
+    finally:
+        tracemalloc.stop()
+
+
+def format_time(seconds):
+    for unit, factor in (('s', 1), ('ms', 1e3), ('us', 1e6)):
+        if seconds * factor >= 1:
+            return '%.2f %s' % (seconds * factor, unit)
+    return '%.2f ns' % (seconds * 1e9)
+
+
+def setup(smtp):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(
+        os.path.abspath(__file__))))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tests.settings')
+    django.setup()
+    from django.test.utils import override_settings
+    overrides = {'DEBUG': False}
+    sink = None
+    if smtp:
+        from benchmarks.smtp_sink import SMTPSink
+        sink = SMTPSink().start()
+        overrides.update({
+            'EMAIL_BACKEND': 'django.core.mail.backends.smtp.EmailBackend',
+            'EMAIL_HOST': '127.0.0.1',
+            'EMAIL_PORT': sink.port,
+        })
+    override_settings(**overrides).enable()
+    return sink
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('names', nargs='*',
+                        help="Benchmarks to run (default: all).")
+    parser.add_argument('--loops', type=int, default=200)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--smtp', action='store_true',
+                        help="Send through a local SMTP sink instead of "
+                             "the locmem email backend.")
+    args = parser.parse_args(argv)
+
+    sink = setup(args.smtp)
+    selected = [b for b in BENCHMARKS
+                if not args.names or b.__name__ in args.names]
+    print('%-20s %14s %10s %12s %12s' % (
+        'benchmark', 'mean', 'stdev', 'ops/s', 'peak alloc'))
+    for bench in selected:
+        func = bench()
+        samples = measure(func, args.loops, args.runs)
+        mean = sum(samples) / len(samples)
+        stdev = math.sqrt(sum((s - mean) ** 2 for s in samples) / len(samples))
+        peak = measure_memory(func, args.loops)
+        print('%-20s %14s %9.1f%% %12.0f %12s' % (
+            bench.__name__, format_time(mean), 100 * stdev / mean, 1 / mean,
+            '-' if peak is None else '%.1f KiB' % (peak / 1024),
+        ))
+    if sink is not None:
+        sink.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Admin for the message archive.
+
+The archive can grow to millions of rows, so the change list never counts
+the whole table and never pages with large offsets. Instead of page
+numbers, the "Older messages" link continues after the last message shown
+(``?id__lt=<pk>``), which is a cheap index range scan at any depth.
+
+The model admin is always registered, but it is only listed on the admin
+index when the table is in use, that is with ``ENVELOPE_ARCHIVE`` enabled
+or a delivery backend which stores messages (``DigestBackend``).
+"""
+
+from django.contrib import admin
+from django.contrib.admin.views.main import PAGE_VAR
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from envelope.delivery import get_delivery_backend
+from envelope.models import ContactMessage
+from envelope.settings import settings
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator which only counts rows up to the end of the next page.
+
+    The count is used by the admin to decide whether there is more than
+    one page; the real total is never computed.
+    """
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.per_page + 1].count()
+
+
+class ContactMessageAdmin(admin.ModelAdmin):
+    list_display = ('created', 'sender', 'email', 'subject', 'status')
+    list_filter = ('status',)
+    search_fields = ('=email',)
+    show_full_result_count = False
+    # "Show all" would load the whole table
+    list_max_show_all = 0
+    paginator = KeysetPaginator
+
+    def has_module_permission(self, request):
+        backend = get_delivery_backend()
+        stores_messages = getattr(backend, 'stores_messages', False)
+        if not (settings.ARCHIVE or stores_messages):
+            return False
+        return super(ContactMessageAdmin, self).has_module_permission(request)
+
+    def changelist_view(self, request, extra_context=None):
+        response = super(ContactMessageAdmin, self).changelist_view(
+            request, extra_context,
+        )
+        context = getattr(response, 'context_data', None) or {}
+        cl = context.get('cl')
+        if cl is not None and cl.multi_page:
+            results = list(cl.result_list)
+            if results:
+                context['older_messages_url'] = cl.get_query_string(
+                    {'id__lt': results[-1].pk}, [PAGE_VAR],
+                )
+        return response
+
+
+admin.site.register(ContactMessage, ContactMessageAdmin)
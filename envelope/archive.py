@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Buffered writes of contact form submissions to the database.
+
+If ``ENVELOPE_ARCHIVE`` is enabled, every submission is stored as a
+:class:`~envelope.models.ContactMessage`. Records are collected in memory
+and written with a single ``bulk_create()`` once ``ENVELOPE_ARCHIVE_BATCH_SIZE``
+of them are pending, or ``ENVELOPE_ARCHIVE_FLUSH_INTERVAL`` seconds after
+the first one was added, whichever comes first.
+"""
+
+import atexit
+import logging
+import threading
+
+from django.db import DatabaseError, close_old_connections
+
+from envelope.settings import settings
+
+
+logger = logging.getLogger('envelope.archive')
+
+
+class MessageArchive(object):
+    """
+    Buffers :class:`~envelope.models.ContactMessage` instances and saves them
+    in bulk.
+
+    A full batch is written in the thread which filled it; a partial one is
+    written by a timer thread. Pending records are also written when the
+    interpreter exits normally, but are lost if the process gets killed.
+    """
+
+    def __init__(self, batch_size=None, flush_interval=None):
+        if batch_size is None:
+            batch_size = settings.ARCHIVE_BATCH_SIZE
+        if flush_interval is None:
+            flush_interval = settings.ARCHIVE_FLUSH_INTERVAL
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def add(self, instance):
+        """
+        Schedules an unsaved model instance to be written.
+        """
+        with self.lock:
+            self.pending.append(instance)
+            if len(self.pending) >= self.batch_size:
+                batch = self._take()
+            else:
+                batch = None
+                if self.timer is None:
+                    self.timer = threading.Timer(self.flush_interval,
+                                                 self._flush_in_background)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if batch:
+            self._write(batch)
+
+    def flush(self):
+        """
+        Writes all pending records in the current thread.
+        """
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._write(batch)
+
+    def _flush_in_background(self):
+        try:
+            self.flush()
+        finally:
+            close_old_connections()
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def _write(self, batch):
+        from envelope.models import ContactMessage
+        try:
+            ContactMessage.objects.bulk_create(batch)
+        except DatabaseError:
+            logger.exception("Could not archive %d messages", len(batch))
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """
+    Returns the process-wide archive, or ``None`` if archiving is disabled.
+    """
+    global _archive
+    if not settings.ARCHIVE:
+        return None
+    if _archive is None:
+        with _archive_lock:
+            if _archive is None:
+                _archive = MessageArchive()
+    return _archive
+
+
+def archive_message(form, status):
+    """
+    Records the submission of a valid form with the given status.
+    """
+    archive = get_archive()
+    if archive is None:
+        return
+    from envelope.models import ContactMessage
+    data = form.cleaned_data
+    archive.add(ContactMessage(
+        sender=data.get('sender', '')[:255],
+        email=data.get('email', ''),
+        subject=data.get('subject', '')[:255],
+        message=data.get('message', ''),
+        status=status,
+    ))
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+File attachments of contact messages.
+
+Uploads are streamed to temporary files by :class:`AttachmentUploadHandler`,
+which enforces the size limits while the request body is being read:
+data beyond ``ENVELOPE_ATTACHMENT_MAX_SIZE`` per file, or
+``ENVELOPE_ATTACHMENT_MAX_TOTAL_SIZE`` for all files together, is discarded
+instead of being stored. The type of each file is determined from its first
+bytes, not from the name or the type claimed by the browser.
+"""
+
+from django import forms
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.template.defaultfilters import filesizeformat
+from django.utils.translation import ugettext_lazy as _
+
+from envelope.settings import settings
+
+
+SNIFF_SIZE = 512
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'image/png'),
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'GIF87a', 'image/gif'),
+    (b'GIF89a', 'image/gif'),
+    (b'%PDF-', 'application/pdf'),
+    (b'PK\x03\x04', 'application/zip'),
+)
+
+
+def sniff_content_type(data):
+    """
+    Guesses the MIME type from the first bytes of a file.
+    """
+    data = data[:SNIFF_SIZE]
+    for signature, content_type in SIGNATURES:
+        if data.startswith(signature):
+            return content_type
+    if data[:4] == b'RIFF' and data[8:12] == b'WEBP':
+        return 'image/webp'
+    if data and b'\0' not in data:
+        try:
+            data.decode('utf-8')
+            return 'text/plain'
+        except UnicodeDecodeError as e:
+            # the sample may end in the middle of a multibyte character
+            if e.start >= len(data) - 3 and e.reason == 'unexpected end of data':
+                return 'text/plain'
+    return 'application/octet-stream'
+
+
+def sniff_file(f):
+    """
+    Returns the MIME type of an uploaded file, reading only its first bytes.
+    """
+    content_type = getattr(f, 'sniffed_content_type', None)
+    if content_type is None:
+        f.seek(0)
+        content_type = sniff_content_type(f.read(SNIFF_SIZE))
+        f.seek(0)
+    return content_type
+
+
+class AttachmentUploadHandler(FileUploadHandler):
+    """
+    Streams uploaded files to disk, enforcing size limits on the way.
+
+    Files exceeding the limits have their data dropped and are marked with
+    ``limit_exceeded``, set to ``'max_size'`` or ``'max_total_size'``
+    depending on which limit was hit, so that the form can reject them
+    with the matching validation error.
+
+    The rest of the request is still read (and discarded) rather than
+    aborted with ``StopUpload``, as that would also drop the form fields
+    which follow the files.
+    """
+
+    def __init__(self, request=None, max_size=None, max_total_size=None):
+        super(AttachmentUploadHandler, self).__init__(request)
+        if max_size is None:
+            max_size = settings.ATTACHMENT_MAX_SIZE
+        if max_total_size is None:
+            max_total_size = settings.ATTACHMENT_MAX_TOTAL_SIZE
+        self.max_size = max_size
+        self.max_total_size = max_total_size
+        self.total_size = 0
+
+    def new_file(self, *args, **kwargs):
+        super(AttachmentUploadHandler, self).new_file(*args, **kwargs)
+        self.file = TemporaryUploadedFile(
+            self.file_name, 'application/octet-stream', 0, self.charset,
+            self.content_type_extra,
+        )
+        self.file.sniffed_content_type = None
+        self.file.limit_exceeded = None
+        if self.content_length and self.content_length > self.max_size:
+            self.file.limit_exceeded = 'max_size'
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        if self.file.sniffed_content_type is None:
+            content_type = sniff_content_type(raw_data)
+            self.file.sniffed_content_type = content_type
+            self.file.content_type = content_type
+        self.size += len(raw_data)
+        self.total_size += len(raw_data)
+        if self.file.limit_exceeded:
+            return
+        if self.size > self.max_size:
+            self.file.limit_exceeded = 'max_size'
+        elif self.total_size > self.max_total_size:
+            self.file.limit_exceeded = 'max_total_size'
+        else:
+            self.file.write(raw_data)
+            return
+        # the file will be rejected, so don't keep what was stored
+        self.file.seek(0)
+        self.file.truncate()
+
+    def file_complete(self, file_size):
+        self.file.seek(0)
+        self.file.size = self.size
+        return self.file
+
+
+class MultipleFileInput(forms.FileInput):
+    """
+    File input which lets the user select several files.
+    """
+
+    def __init__(self, attrs=None):
+        attrs = dict(attrs or {}, multiple=True)
+        super(MultipleFileInput, self).__init__(attrs)
+
+    def value_from_datadict(self, data, files, name):
+        if hasattr(files, 'getlist'):
+            return files.getlist(name)
+        value = files.get(name)
+        return [value] if value else []
+
+
+class AttachmentsField(forms.FileField):
+    """
+    Field accepting a list of files, within the configured limits.
+
+    Only files whose sniffed type is listed in ``ENVELOPE_ATTACHMENT_TYPES``
+    are accepted. The cleaned value is a list of uploaded files.
+    """
+    widget = MultipleFileInput
+    default_error_messages = {
+        'max_files': _("You can attach at most %(count)d files."),
+        'max_size': _("%(name)s is larger than %(size)s."),
+        'max_total_size': _("The attachments are larger than %(size)s."),
+        'content_type': _("Files of type %(content_type)s are not accepted."),
+    }
+
+    def clean(self, data, initial=None):
+        files = [f for f in (data or []) if f]
+        if not files:
+            if self.required:
+                raise forms.ValidationError(self.error_messages['required'],
+                                            code='required')
+            return []
+        files = [super(AttachmentsField, self).clean(f) for f in files]
+        if len(files) > settings.ATTACHMENT_MAX_FILES:
+            raise forms.ValidationError(
+                self.error_messages['max_files'], code='max_files',
+                params={'count': settings.ATTACHMENT_MAX_FILES},
+            )
+        total_size = 0
+        total_exceeded = False
+        for f in files:
+            limit_exceeded = getattr(f, 'limit_exceeded', None)
+            total_exceeded |= limit_exceeded == 'max_total_size'
+            if limit_exceeded == 'max_size' or \
+                    f.size > settings.ATTACHMENT_MAX_SIZE:
+                raise forms.ValidationError(
+                    self.error_messages['max_size'], code='max_size',
+                    params={
+                        'name': f.name,
+                        'size': filesizeformat(settings.ATTACHMENT_MAX_SIZE),
+                    },
+                )
+            total_size += f.size
+            content_type = sniff_file(f)
+            if content_type not in settings.ATTACHMENT_TYPES:
+                raise forms.ValidationError(
+                    self.error_messages['content_type'], code='content_type',
+                    params={'content_type': content_type},
+                )
+        if total_exceeded or total_size > settings.ATTACHMENT_MAX_TOTAL_SIZE:
+            raise forms.ValidationError(
+                self.error_messages['max_total_size'], code='max_total_size',
+                params={
+                    'size': filesizeformat(settings.ATTACHMENT_MAX_TOTAL_SIZE),
+                },
+            )
+        return files
+
+    def bound_data(self, data, initial):
+        return data
+
+    def has_changed(self, initial, data):
+        return bool(data)
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Caches used by envelope.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+
+from envelope.settings import settings
+
+
+def get_cache():
+    """
+    Returns the Django cache configured with ``ENVELOPE_CACHE_ALIAS``.
+    """
+    return caches[settings.CACHE_ALIAS]
+
+
+class TTLCache(object):
+    """
+    A small in-process cache with per-entry expiration.
+
+    When the cache holds ``max_size`` entries, the least recently used
+    entry is evicted. The ``get()``, ``set()``, ``add()`` and ``delete()``
+    methods mimic the Django cache API, so both kinds of cache can be used
+    interchangeably.
+    """
+
+    def __init__(self, max_size=1000):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            try:
+                value, expires = self.entries[key]
+            except KeyError:
+                return default
+            if expires <= now:
+                del self.entries[key]
+                return default
+            # move the entry to the end, marking it as recently used
+            del self.entries[key]
+            self.entries[key] = (value, expires)
+            return value
+
+    def set(self, key, value, timeout, now=None):
+        if now is None:
+            now = time.time()
+        with self.lock:
+            self._set(key, value, timeout, now)
+
+    def add(self, key, value, timeout, now=None):
+        """
+        Sets the value only if the key is not in the cache yet.
+
+        Returns ``True`` if the value was stored.
+        """
+        if now is None:
+            now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[1] > now:
+                return False
+            self._set(key, value, timeout, now)
+            return True
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def _set(self, key, value, timeout, now):
+        # must be called with the lock held
+        self.entries.pop(key, None)
+        self.entries[key] = (value, now + timeout)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
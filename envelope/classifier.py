@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Naive Bayes content classifier for contact messages.
+
+Tokens (lowercased words and word bigrams) are hashed into a fixed number
+of buckets. For every bucket the model stores the log-likelihood ratio of
+the token appearing in spam versus legitimate ("ham") messages. The model
+file is memory-mapped, so loading it is instant and the pages are shared
+between processes.
+"""
+
+import math
+import mmap
+import re
+import struct
+import zlib
+
+from envelope.settings import settings
+
+
+MAGIC = b'ENVNB001'
+HEADER = struct.Struct('<8sIf')
+WEIGHT = struct.Struct('<f')
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(text):
+    """
+    Returns unique word unigrams and bigrams found in the text.
+    """
+    words = TOKEN_RE.findall(text.lower())
+    tokens = set(words)
+    tokens.update('%s %s' % pair for pair in zip(words, words[1:]))
+    return tokens
+
+
+def get_bucket(token, buckets):
+    return zlib.crc32(token.encode('utf-8')) % buckets
+
+
+class Trainer(object):
+    """
+    Accumulates token counts from labelled messages and writes a model.
+    """
+
+    def __init__(self, buckets=2 ** 18):
+        self.buckets = buckets
+        self.spam_counts = {}
+        self.ham_counts = {}
+        self.spam_total = 0
+        self.ham_total = 0
+
+    def add(self, text, is_spam):
+        counts = self.spam_counts if is_spam else self.ham_counts
+        for token in tokenize(text):
+            bucket = get_bucket(token, self.buckets)
+            counts[bucket] = counts.get(bucket, 0) + 1
+        if is_spam:
+            self.spam_total += 1
+        else:
+            self.ham_total += 1
+
+    def save(self, path):
+        """
+        Writes the model to ``path``.
+        """
+        spam_total = self.spam_total + 2.0
+        ham_total = self.ham_total + 2.0
+        prior = math.log(spam_total / ham_total)
+        with open(path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, self.buckets, prior))
+            for bucket in range(self.buckets):
+                spam = (self.spam_counts.get(bucket, 0) + 1) / spam_total
+                ham = (self.ham_counts.get(bucket, 0) + 1) / ham_total
+                f.write(WEIGHT.pack(math.log(spam / ham)))
+
+
+class Classifier(object):
+    """
+    Scores messages with a memory-mapped model written by :class:`Trainer`.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.buckets, self.prior = HEADER.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            raise ValueError("%s is not an envelope classifier model" % path)
+
+    def score(self, text):
+        """
+        Returns the probability that the text is spam.
+        """
+        unpack_from = WEIGHT.unpack_from
+        data = self.data
+        offset = HEADER.size
+        buckets = self.buckets
+        total = self.prior
+        for token in tokenize(text):
+            position = offset + WEIGHT.size * get_bucket(token, buckets)
+            total += unpack_from(data, position)[0]
+        total = max(min(total, 50), -50)
+        return 1.0 / (1.0 + math.exp(-total))
+
+
+_classifiers = {}
+
+
+def get_classifier():
+    """
+    Returns the classifier using ``ENVELOPE_CLASSIFIER_MODEL``.
+
+    Returns ``None`` if no model is configured.
+    """
+    path = settings.CLASSIFIER_MODEL
+    if not path:
+        return None
+    try:
+        return _classifiers[path]
+    except KeyError:
+        return _classifiers.setdefault(path, Classifier(path))
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+A pool of mail server connections shared by the threads of a process.
+"""
+
+import logging
+import socket
+import threading
+import time
+from smtplib import SMTPException
+
+from django.core import mail
+
+from envelope.settings import settings
+
+
+logger = logging.getLogger('envelope.connections')
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no pooled connection became available in time.
+    """
+
+
+class ConnectionPool(object):
+    """
+    Keeps open email backend connections for reuse.
+
+    At most ``size`` connections are checked out at the same time; further
+    callers wait until a connection is released, but no longer than
+    ``timeout`` seconds. Idle connections older than ``max_idle`` seconds
+    are closed instead of reused, and SMTP connections are checked with
+    a ``NOOP`` command before they are handed out.
+    """
+
+    def __init__(self, size, max_idle, timeout=None):
+        self.size = size
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self.idle = []
+        self.checked_out = 0
+        self.lock = threading.Lock()
+        self.available = threading.Condition(self.lock)
+
+    def acquire(self, timeout=None):
+        """
+        Returns an open connection, reusing an idle one if possible.
+
+        Raises :class:`PoolTimeout` if all connections stay checked out
+        for ``timeout`` seconds (defaults to the timeout of the pool).
+        """
+        if timeout is None:
+            timeout = self.timeout
+        self.reserve(timeout)
+        try:
+            while True:
+                with self.lock:
+                    item = self.idle.pop() if self.idle else None
+                if item is None:
+                    connection = mail.get_connection()
+                    connection.open()
+                    return connection
+                connection, last_used = item
+                if (time.time() - last_used <= self.max_idle and
+                        self.is_alive(connection)):
+                    return connection
+                self.discard(connection)
+        except Exception:
+            self.unreserve()
+            raise
+
+    def reserve(self, timeout):
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self.available:
+            while self.checked_out >= self.size:
+                if timeout is None:
+                    self.available.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    raise PoolTimeout(
+                        "No mail server connection available after %s "
+                        "seconds" % timeout
+                    )
+                self.available.wait(remaining)
+            self.checked_out += 1
+
+    def unreserve(self):
+        with self.available:
+            self.checked_out -= 1
+            self.available.notify()
+
+    def release(self, connection, broken=False):
+        """
+        Returns the connection to the pool.
+
+        Connections marked as ``broken`` are closed, so that a fresh one
+        is opened next time.
+        """
+        try:
+            if broken:
+                self.discard(connection)
+            else:
+                with self.lock:
+                    self.idle.append((connection, time.time()))
+        finally:
+            self.unreserve()
+
+    def discard(self, connection):
+        try:
+            connection.close()
+        except (SMTPException, socket.error):
+            pass
+
+    def clear(self):
+        """
+        Closes all idle connections.
+        """
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection, last_used in idle:
+            self.discard(connection)
+
+    def is_alive(self, connection):
+        return is_alive(connection)
+
+
+def is_alive(connection):
+    """
+    Checks whether the connection can still be used.
+
+    Only the SMTP backend keeps a real connection; connections of other
+    email backends are always considered alive.
+    """
+    if not hasattr(connection, 'connection'):
+        return True
+    if connection.connection is None:
+        return False
+    try:
+        status = connection.connection.noop()[0]
+    except (SMTPException, socket.error):
+        return False
+    return status == 250
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_connection_pool():
+    """
+    Returns the process-wide connection pool.
+
+    Returns ``None`` if pooling is disabled (``ENVELOPE_CONNECTION_POOL_SIZE``
+    is 0).
+    """
+    global _pool
+    if not settings.CONNECTION_POOL_SIZE:
+        return None
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(settings.CONNECTION_POOL_SIZE,
+                                       settings.CONNECTION_MAX_IDLE,
+                                       settings.CONNECTION_POOL_TIMEOUT)
+    return _pool
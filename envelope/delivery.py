@@ -0,0 +1,540 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Delivery backends which hand the rendered message over to the mail server.
+"""
+
+import atexit
+import itertools
+import logging
+import socket
+import threading
+from operator import attrgetter
+from smtplib import SMTPException
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.db import close_old_connections
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext_lazy as _, ungettext
+
+from envelope.settings import settings
+from envelope.connections import PoolTimeout, get_connection_pool, is_alive
+from envelope.metrics import get_metrics, timer
+from envelope.rendering import render_email
+from envelope.signals import after_send
+from envelope.spool import Spool
+
+
+logger = logging.getLogger('envelope.delivery')
+
+
+class BaseDeliveryBackend(object):
+    """
+    Base class for delivery backends.
+
+    Subclasses must implement ``deliver()``, which either sends the message
+    right away or schedules it to be sent later. In both cases the actual
+    sending should go through ``send()``, so that the ``after_send`` signal
+    fires only when the message really left the application.
+    """
+
+    def deliver(self, message, form):
+        """
+        Sends the message or schedules it for delivery.
+
+        Returns ``True`` if the message was accepted by the backend.
+        """
+        raise NotImplementedError
+
+    def send(self, message, form=None, sender=None):
+        """
+        Sends the message immediately and fires the ``after_send`` signal.
+
+        If the form object is no longer available (for example when the
+        message is sent from the spool), the form class should be passed
+        as ``sender``.
+
+        Returns ``True`` if the message was sent successfully.
+        """
+        if sender is None:
+            sender = form.__class__
+        metrics = get_metrics()
+        if metrics is not None:
+            start = timer()
+        try:
+            message.send()
+        except SMTPException:
+            logger.exception(_("An error occured while sending the email"))
+            if metrics is not None:
+                metrics.increment('send_failed')
+            return False
+        if metrics is not None:
+            metrics.timing('send', timer() - start)
+            metrics.increment('sent')
+        after_send.send(sender=sender, message=message, form=form)
+        logger.info(_("Contact form submitted and sent (from: %s)") %
+                    message.extra_headers.get('Reply-To'))
+        return True
+
+    def send_pooled(self, message, form):
+        """
+        Like ``send()``, but uses a pooled connection if connection pooling
+        is enabled.
+        """
+        if get_connection_pool() is not None:
+            return self.send_many([(message, form, form.__class__)])[0]
+        return self.send(message, form)
+
+    def deliver_many(self, messages):
+        """
+        Delivers messages from an iterable of ``(message, form)`` pairs.
+
+        Yields a boolean for every message, like ``deliver()`` returns.
+        The messages are consumed lazily, so the iterable can be a generator
+        of any length. The default implementation delivers them one by one.
+        """
+        for message, form in messages:
+            yield self.deliver(message, form)
+
+    def send_many(self, messages, connection=None):
+        """
+        Sends several messages over a single mail server connection.
+
+        ``messages`` is a sequence of ``(message, form, sender)`` tuples.
+        Returns a list of booleans telling which messages were sent.
+
+        If ``connection`` is not given, one is opened for these messages
+        and closed afterwards. If ``ENVELOPE_CONNECTION_POOL_SIZE`` is set,
+        the connection is taken from the shared pool and returned there.
+
+        If the server drops the connection in the middle of the batch, it is
+        reopened once and the message which failed is sent again, so that
+        a single disconnect doesn't fail the rest of the batch.
+        """
+        owned = connection is None
+        if owned:
+            connection = self.open_connection()
+            if connection is None:
+                return [False] * len(messages)
+        results = []
+        reconnected = False
+        try:
+            for message, form, sender in messages:
+                result = self._send_over(connection, message, form, sender)
+                if (not result and not reconnected and
+                        not is_alive(connection)):
+                    reconnected = True
+                    if self.reopen_connection(connection):
+                        result = self._send_over(connection, message, form,
+                                                 sender)
+                results.append(result)
+        finally:
+            if owned:
+                self.close_connection(connection, broken=not all(results))
+        return results
+
+    def _send_over(self, connection, message, form, sender):
+        message.connection = connection
+        try:
+            return self.send(message, form, sender)
+        except socket.error:
+            logger.exception("Could not connect to the mail server")
+            return False
+        finally:
+            message.connection = None
+
+    def reopen_connection(self, connection):
+        """
+        Reconnects a connection dropped by the server.
+
+        Returns ``True`` on success.
+        """
+        logger.warning("Lost the mail server connection, reconnecting")
+        try:
+            connection.close()
+        except (SMTPException, socket.error):
+            pass
+        try:
+            connection.open()
+        except (SMTPException, socket.error):
+            logger.exception("Could not connect to the mail server")
+            return False
+        return True
+
+    def open_connection(self):
+        """
+        Returns an open mail server connection, or ``None`` on failure.
+        """
+        pool = get_connection_pool()
+        try:
+            if pool is not None:
+                return pool.acquire()
+            connection = mail.get_connection()
+            connection.open()
+            return connection
+        except PoolTimeout:
+            logger.error("All pooled mail server connections are busy")
+            return None
+        except (SMTPException, socket.error):
+            logger.exception("Could not connect to the mail server")
+            return None
+
+    def close_connection(self, connection, broken=False):
+        pool = get_connection_pool()
+        if pool is not None:
+            pool.release(connection, broken=broken)
+        else:
+            connection.close()
+
+
+class ImmediateBackend(BaseDeliveryBackend):
+    """
+    Sends the message within the current request (the default).
+
+    If connection pooling is enabled, the message is sent over a pooled
+    connection instead of a new one.
+    """
+
+    def deliver(self, message, form):
+        return self.send_pooled(message, form)
+
+    def deliver_many(self, messages, chunk_size=None):
+        """
+        Sends all messages over a single connection, in chunks of
+        ``chunk_size`` (defaults to ``ENVELOPE_BATCH_SIZE``) messages.
+        """
+        if chunk_size is None:
+            chunk_size = settings.BATCH_SIZE
+        messages = iter(messages)
+        connection = None
+        try:
+            while True:
+                chunk = [(message, form, form.__class__) for message, form
+                         in itertools.islice(messages, chunk_size)]
+                if not chunk:
+                    break
+                if connection is None:
+                    connection = self.open_connection()
+                if connection is None:
+                    results = [False] * len(chunk)
+                else:
+                    results = self.send_many(chunk, connection=connection)
+                if not all(results) and connection is not None:
+                    # start over with a fresh connection
+                    self.close_connection(connection, broken=True)
+                    connection = None
+                for result in results:
+                    yield result
+        finally:
+            if connection is not None:
+                self.close_connection(connection)
+
+
+class ThreadedBackend(BaseDeliveryBackend):
+    """
+    Hands the message over to a pool of background threads.
+
+    The request returns as soon as the message is enqueued. The size of
+    the pool and of the queue are controlled by ``ENVELOPE_DELIVERY_THREADS``
+    and ``ENVELOPE_DELIVERY_QUEUE_SIZE``. If the queue is full, the message
+    is sent within the current request instead of being dropped.
+
+    Pending messages are kept in memory only, so they are lost if the
+    process exits before the workers are done.
+    """
+
+    def __init__(self, threads=None, queue_size=None):
+        if threads is None:
+            threads = settings.DELIVERY_THREADS
+        if queue_size is None:
+            queue_size = settings.DELIVERY_QUEUE_SIZE
+        self.threads = threads
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def deliver(self, message, form):
+        self.start()
+        try:
+            self.queue.put_nowait((message, form))
+        except queue.Full:
+            logger.warning("Delivery queue is full, sending synchronously")
+            return self.send_pooled(message, form)
+        return True
+
+    def start(self):
+        """
+        Starts the worker threads, unless they are already running.
+        """
+        if len(self.workers) >= self.threads:
+            return
+        with self.lock:
+            while len(self.workers) < self.threads:
+                worker = threading.Thread(
+                    target=self.work,
+                    name='envelope-delivery-%d' % len(self.workers),
+                )
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+    def work(self):
+        """
+        Worker thread loop: sends messages as they appear in the queue.
+        """
+        while True:
+            message, form = self.queue.get()
+            try:
+                self.send_pooled(message, form)
+            except Exception:
+                logger.exception("Unexpected error in the delivery thread")
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def join(self):
+        """
+        Blocks until all enqueued messages have been processed.
+        """
+        self.queue.join()
+
+
+class SpoolBackend(BaseDeliveryBackend):
+    """
+    Writes the message to an on-disk spool (``ENVELOPE_SPOOL_DIR``).
+
+    The spool is drained by the ``envelope_flush`` management command,
+    which retries failed deliveries with exponential backoff and moves
+    messages that keep failing to a dead letter directory. The
+    ``after_send`` signal is sent by the command, with ``form`` set
+    to ``None``.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = settings.SPOOL_DIR
+        if not directory:
+            raise ImproperlyConfigured(
+                "ENVELOPE_SPOOL_DIR must be set to use the spool backend."
+            )
+        self.spool = Spool(directory,
+                           max_attempts=settings.SPOOL_MAX_ATTEMPTS,
+                           retry_delay=settings.SPOOL_RETRY_DELAY)
+
+    def deliver(self, message, form):
+        message.connection = None
+        self.spool.put(message, sender=form.__class__)
+        return True
+
+    def flush(self, batch_size=None):
+        """
+        Sends due messages from the spool.
+
+        Returns a ``(sent, deferred, failed)`` tuple of message counts.
+        """
+        if batch_size is None:
+            batch_size = settings.SPOOL_BATCH_SIZE
+        sent = deferred = failed = 0
+        while True:
+            entries = self.spool.pending(limit=batch_size)
+            if not entries:
+                break
+            results = self.send_many([
+                (entry.message, None, entry.sender) for entry in entries
+            ])
+            for entry, success in zip(entries, results):
+                if success:
+                    self.spool.remove(entry)
+                    sent += 1
+                elif self.spool.retry(entry):
+                    deferred += 1
+                else:
+                    failed += 1
+        return sent, deferred, failed
+
+
+class BatchBackend(BaseDeliveryBackend):
+    """
+    Collects messages and sends them in batches over a single connection.
+
+    A batch is sent from a background thread as soon as it reaches
+    ``ENVELOPE_BATCH_SIZE`` messages, or ``ENVELOPE_BATCH_TIMEOUT`` seconds
+    after its first message was enqueued, whichever comes first. The
+    ``after_send`` signal fires for every message that was actually sent.
+
+    Like with ``ThreadedBackend``, pending messages are kept in memory.
+    They are sent when the interpreter exits normally, but are lost if the
+    process gets killed.
+    """
+
+    def __init__(self, batch_size=None, timeout=None):
+        if batch_size is None:
+            batch_size = settings.BATCH_SIZE
+        if timeout is None:
+            timeout = settings.BATCH_TIMEOUT
+        self.batch_size = batch_size
+        self.timeout = timeout
+        self.pending = []
+        self.timer = None
+        self.lock = threading.Lock()
+        atexit.register(self.flush)
+
+    def deliver(self, message, form):
+        with self.lock:
+            self.pending.append((message, form, form.__class__))
+            if len(self.pending) >= self.batch_size:
+                batch = self._take()
+            else:
+                batch = None
+                if self.timer is None:
+                    self.timer = threading.Timer(self.timeout, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+        if batch:
+            worker = threading.Thread(target=self._send_batch, args=(batch,))
+            worker.daemon = True
+            worker.start()
+        return True
+
+    def flush(self):
+        """
+        Sends all pending messages in the current thread.
+        """
+        with self.lock:
+            batch = self._take()
+        if batch:
+            self._send_batch(batch)
+
+    def _take(self):
+        batch, self.pending = self.pending, []
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return batch
+
+    def _send_batch(self, batch):
+        try:
+            results = self.send_many(batch)
+            logger.info("Sent %d of %d messages in a batch",
+                        sum(results), len(batch))
+        except Exception:
+            logger.exception("Unexpected error while sending a batch")
+        finally:
+            close_old_connections()
+
+
+class DigestBackend(BaseDeliveryBackend):
+    """
+    Stores messages in the database and sends them later as digests.
+
+    Run the ``envelope_digest`` management command periodically (e.g. daily
+    from cron) to send a single email per distinct list of recipients,
+    containing every message stored since the previous run. Each entry is
+    rendered with the ``envelope/digest_entry.txt`` template. Digests are
+    split after ``ENVELOPE_DIGEST_MAX_MESSAGES`` entries.
+
+    The rendered subject and plaintext body of each message are stored, so
+    extra form fields and custom ``get_subject()`` or ``get_context()``
+    output end up in the digest. The HTML part and attachments are not
+    kept.
+
+    The ``after_send`` signal fires once per digest, with this backend class
+    as ``sender`` and ``form`` set to ``None``.
+    """
+    stores_messages = True
+    entry_template_name = 'envelope/digest_entry.txt'
+
+    def deliver(self, message, form):
+        from envelope.models import ContactMessage
+        data = form.cleaned_data
+        if message.attachments:
+            logger.warning("Attachments are not included in digests")
+        ContactMessage.objects.create(
+            sender=data.get('sender', '')[:255],
+            email=data.get('email', ''),
+            subject=message.subject[:255],
+            message=data.get('message', ''),
+            body=message.body,
+            recipients=','.join(message.to),
+            status=ContactMessage.PENDING,
+        )
+        return True
+
+    def flush(self, max_messages=None):
+        """
+        Sends all pending messages as digests.
+
+        Messages are streamed from the database in recipients order, so only
+        one digest is kept in memory at a time. Messages whose digest could
+        not be sent stay pending until the next run.
+
+        Returns a ``(digests, messages)`` tuple of sent counts.
+        """
+        from envelope.models import ContactMessage
+        if max_messages is None:
+            max_messages = settings.DIGEST_MAX_MESSAGES
+        pending = ContactMessage.objects.filter(
+            status=ContactMessage.PENDING,
+        ).order_by('recipients', 'id')
+        digests = messages = 0
+        groups = itertools.groupby(pending.iterator(),
+                                   key=attrgetter('recipients'))
+        for recipients, entries in groups:
+            while True:
+                chunk = list(itertools.islice(entries, max_messages))
+                if not chunk:
+                    break
+                message = self.get_digest(recipients.split(','), chunk)
+                if not self.send_many([(message, None, self.__class__)])[0]:
+                    continue
+                ContactMessage.objects.filter(
+                    pk__in=[entry.pk for entry in chunk],
+                ).update(status=ContactMessage.ACCEPTED)
+                digests += 1
+                messages += len(chunk)
+        return digests, messages
+
+    def get_digest(self, recipients, entries):
+        """
+        Returns the email message with the given entries.
+        """
+        body = ''.join(
+            render_email(self.entry_template_name, {'entry': entry})
+            for entry in entries
+        )
+        count = ungettext("%d message", "%d messages", len(entries))
+        return mail.EmailMessage(
+            subject='%s%s' % (settings.SUBJECT_INTRO, count % len(entries)),
+            body=body,
+            from_email=settings.FROM_EMAIL,
+            to=recipients,
+        )
+
+
+_backends = {}
+_backends_lock = threading.Lock()
+
+
+def get_delivery_backend(path=None):
+    """
+    Returns a (shared) instance of the delivery backend.
+
+    By default the backend class is taken from ``ENVELOPE_DELIVERY_BACKEND``.
+    """
+    if path is None:
+        path = settings.DELIVERY_BACKEND
+    try:
+        return _backends[path]
+    except KeyError:
+        with _backends_lock:
+            if path not in _backends:
+                _backends[path] = import_string(path)()
+            return _backends[path]
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Detection of repeated submissions of the same message.
+"""
+
+import hashlib
+import re
+
+from envelope.cache import TTLCache, get_cache
+from envelope.settings import settings
+
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+local_cache = TTLCache()
+
+
+def normalize(value):
+    return WHITESPACE_RE.sub(' ', '%s' % value).strip().lower()
+
+
+def get_fingerprint(data, fields=('email', 'subject', 'message')):
+    """
+    Returns a hash of the given fields of a submission.
+
+    Differences in letter case and whitespace are ignored.
+    """
+    digest = hashlib.sha1()
+    for field in fields:
+        digest.update(normalize(data.get(field, '')).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()
+
+
+def is_duplicate(fingerprint):
+    """
+    Checks whether the fingerprint was seen within the duplicate window.
+
+    Every call remembers the fingerprint for ``ENVELOPE_DUPLICATE_WINDOW``
+    seconds, either in this process or, if ``ENVELOPE_DUPLICATE_CACHE`` is
+    ``'cache'``, in the Django cache. Always returns ``False`` if the window
+    is not set.
+    """
+    window = settings.DUPLICATE_WINDOW
+    if not window:
+        return False
+    return not get_fingerprint_cache().add(get_key(fingerprint), True, window)
+
+
+def forget_fingerprint(fingerprint):
+    """
+    Forgets a fingerprint remembered by :func:`is_duplicate`.
+
+    Used when the message could not be delivered, so that the user can
+    submit it again.
+    """
+    if settings.DUPLICATE_WINDOW:
+        get_fingerprint_cache().delete(get_key(fingerprint))
+
+
+def get_fingerprint_cache():
+    if settings.DUPLICATE_CACHE == 'cache':
+        return get_cache()
+    local_cache.max_size = settings.DUPLICATE_CACHE_SIZE
+    return local_cache
+
+
+def get_key(fingerprint):
+    return 'envelope:fingerprint:%s' % fingerprint
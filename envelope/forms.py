@@ -7,15 +7,25 @@ Contact form class definitions.
 """
 
 import logging
-from smtplib import SMTPException
+import os
+from collections import deque
 
 from django import forms
-from django.core import mail
-from django.template.loader import render_to_string
+from django.utils.html import escape, linebreaks
 from django.utils.translation import ugettext_lazy as _
 
-from envelope import settings
-from envelope.signals import after_send
+from envelope.archive import archive_message
+from envelope.attachments import AttachmentsField, sniff_file
+from envelope.delivery import get_delivery_backend
+from envelope.duplicates import (
+    forget_fingerprint, get_fingerprint, is_duplicate,
+)
+from envelope.images import RelatedEmailMessage, get_inline_images
+from envelope.metrics import get_metrics, timer
+from envelope.rendering import render_email
+from envelope.routing import get_router
+from envelope.settings import LazySetting, settings
+from envelope.validators import validate_email_domain
 
 
 logger = logging.getLogger('envelope.forms')
@@ -49,15 +59,20 @@ class ContactForm(forms.Form):
         Template used to render the HTML email message. Defaults to
         ``envelope/email_body.html``.
 
+    ``verify_email_domain``
+        Whether to check that the email domain accepts mail. Defaults to
+        ``settings.ENVELOPE_VERIFY_EMAIL_DOMAIN``.
+
     """
     sender = forms.CharField(label=_("From"))
     email = forms.EmailField(label=_("Email"))
     subject = forms.CharField(label=_("Subject"), required=False)
     message = forms.CharField(label=_("Message"), widget=forms.Textarea())
 
-    subject_intro = settings.SUBJECT_INTRO
-    from_email = settings.FROM_EMAIL
-    email_recipients = settings.EMAIL_RECIPIENTS
+    subject_intro = LazySetting('SUBJECT_INTRO')
+    from_email = LazySetting('FROM_EMAIL')
+    email_recipients = LazySetting('EMAIL_RECIPIENTS')
+    verify_email_domain = LazySetting('VERIFY_EMAIL_DOMAIN')
     template_name = 'envelope/email_body.txt'
     html_template_name = 'envelope/email_body.html'
 
@@ -67,37 +82,156 @@ class ContactForm(forms.Form):
                 setattr(self, kwarg, kwargs.pop(kwarg))
         super(ContactForm, self).__init__(*args, **kwargs)
 
+    def clean_email(self):
+        """
+        Checks the email domain if ``verify_email_domain`` is set.
+        """
+        email = self.cleaned_data['email']
+        if self.verify_email_domain:
+            validate_email_domain(email)
+        return email
+
     def save(self):
         """
         Sends the message.
+
+        The message is handed over to the delivery backend configured with
+        ``ENVELOPE_DELIVERY_BACKEND``. Returns ``True`` if the backend
+        accepted the message.
+
+        If ``ENVELOPE_DUPLICATE_WINDOW`` is set, repeated submissions of the
+        same message within that window are silently dropped.
+
+        If ``ENVELOPE_ARCHIVE`` is enabled, the submission is also recorded
+        in the database.
+        """
+        fingerprint = self.get_fingerprint()
+        if is_duplicate(fingerprint):
+            logger.info("Dropped a duplicate submission (from: %s)",
+                        self.cleaned_data.get('email'))
+            return True
+        message = self.get_message()
+        backend = get_delivery_backend()
+        result = backend.deliver(message, self)
+        if not result:
+            forget_fingerprint(fingerprint)
+        if not getattr(backend, 'stores_messages', False):
+            from envelope.models import ContactMessage
+            archive_message(self, ContactMessage.ACCEPTED if result
+                            else ContactMessage.FAILED)
+        return result
+
+    @classmethod
+    def save_many(cls, forms):
         """
+        Validates and sends messages from an iterable of bound forms.
+
+        The forms are consumed lazily and messages are handed over to the
+        delivery backend as a stream (``ImmediateBackend`` sends them over a
+        single connection), so a generator of any length is processed in
+        constant memory. Invalid forms are skipped. Note that the
+        ``before_send`` signal, and with it spam filtering, only runs in
+        the view, not here.
+
+        Returns a ``(sent, failed, invalid, duplicates)`` tuple of message
+        counts, where ``duplicates`` counts the messages dropped as repeated
+        submissions (see ``ENVELOPE_DUPLICATE_WINDOW``).
+        """
+        backend = get_delivery_backend()
+        archive = not getattr(backend, 'stores_messages', False)
+        pending = deque()
+        counts = {'sent': 0, 'invalid': 0, 'duplicates': 0}
+
+        def messages():
+            for form in forms:
+                if not form.is_valid():
+                    counts['invalid'] += 1
+                elif is_duplicate(form.get_fingerprint()):
+                    counts['duplicates'] += 1
+                else:
+                    pending.append(form)
+                    yield form.get_message(), form
+
+        failed = 0
+        for result in backend.deliver_many(messages()):
+            form = pending.popleft()
+            if result:
+                counts['sent'] += 1
+            else:
+                failed += 1
+                forget_fingerprint(form.get_fingerprint())
+            if archive:
+                from envelope.models import ContactMessage
+                archive_message(form, ContactMessage.ACCEPTED if result
+                                else ContactMessage.FAILED)
+        return (counts['sent'], failed, counts['invalid'],
+                counts['duplicates'])
+
+    def get_message(self):
+        """
+        Returns an email message object ready to be sent.
+        """
+        metrics = get_metrics()
+        if metrics is not None:
+            start = timer()
         subject = self.get_subject()
         from_email = self.get_from_email()
         email_recipients = self.get_email_recipients()
         context = self.get_context()
-        message_body = render_to_string(self.get_template_names(), context)
-        try:
-            message = mail.EmailMultiAlternatives(
-                subject=subject,
-                body=message_body,
-                from_email=from_email,
-                to=email_recipients,
-                headers={
-                    'Reply-To': self.cleaned_data['email']
-                }
-            )
-            if settings.USE_HTML_EMAIL:
-                html_body = render_to_string(self.html_template_name, context)
-                message.attach_alternative(html_body, "text/html")
-            message.send()
-            after_send.send(sender=self.__class__, message=message, form=self)
-            logger.info(_("Contact form submitted and sent (from: %s)") %
-                        self.cleaned_data['email'])
-        except SMTPException:
-            logger.exception(_("An error occured while sending the email"))
-            return False
-        else:
-            return True
+        message_body = render_email(self.get_template_names(), context)
+        message = RelatedEmailMessage(
+            subject=subject,
+            body=message_body,
+            from_email=from_email,
+            to=email_recipients,
+            headers={
+                'Reply-To': self.cleaned_data['email']
+            }
+        )
+        if settings.USE_HTML_EMAIL:
+            html_body = self.get_html_body(context, message_body)
+            message.attach_alternative(html_body, "text/html")
+            self.attach_inline_images(message, html_body)
+        if metrics is not None:
+            metrics.timing('render', timer() - start)
+        return message
+
+    def get_html_body(self, context, message_body):
+        """
+        Returns the HTML version of the message.
+
+        If ``ENVELOPE_HTML_FROM_TEXT`` is enabled, the HTML is built from the
+        already rendered plaintext body instead of rendering a second template.
+        The body is always escaped: it is plain text even though Django
+        marks rendered templates as safe.
+        """
+        if settings.HTML_FROM_TEXT:
+            return linebreaks(escape(message_body))
+        images = get_inline_images()
+        if images:
+            context = dict(context, envelope_images=dict(
+                (name, image.src) for name, image in images.items()
+            ))
+        return render_email(self.html_template_name, context)
+
+    def attach_inline_images(self, message, html_body):
+        """
+        Attaches images from ``ENVELOPE_INLINE_IMAGES`` used in the HTML.
+
+        The HTML template gets an ``envelope_images`` variable mapping image
+        names to their ``cid:`` URLs.
+        """
+        for image in get_inline_images().values():
+            if image.src in html_body:
+                message.attach_related(image.part)
+
+    def get_fingerprint(self):
+        """
+        Returns a hash identifying the content of the message.
+
+        Override to change which fields make two submissions identical.
+        """
+        return get_fingerprint(self.cleaned_data)
 
     def get_context(self):
         """
@@ -129,8 +263,15 @@ class ContactForm(forms.Form):
         """
         Returns a list of recipients for the message.
 
+        If ``ENVELOPE_ROUTES`` is set, the recipients of the matching rules
+        are used; otherwise (or if nothing matches) ``email_recipients``.
         Override to customize how the email recipients are determined.
         """
+        router = get_router()
+        if router is not None:
+            recipients = router.route(self.cleaned_data)
+            if recipients:
+                return recipients
         return self.email_recipients
 
     def get_template_names(self):
@@ -141,3 +282,23 @@ class ContactForm(forms.Form):
         Override to use your own method choosing a template name.
         """
         return self.template_name
+
+
+class AttachmentContactForm(ContactForm):
+    """
+    Contact form which lets the user attach files to the message.
+
+    Use it with :class:`~envelope.views.AttachmentContactView`, which
+    streams the uploads to disk and enforces the size limits while the
+    request is being read. Accepted files are attached to the email
+    message when it is built, so a queued message does not depend on the
+    temporary files.
+    """
+    attachments = AttachmentsField(label=_("Attachments"), required=False)
+
+    def get_message(self):
+        message = super(AttachmentContactForm, self).get_message()
+        for f in self.cleaned_data.get('attachments', []):
+            content_type = sniff_file(f)
+            message.attach(os.path.basename(f.name), f.read(), content_type)
+        return message
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Images embedded in HTML email messages.
+
+``ENVELOPE_INLINE_IMAGES`` maps names to image files, given either as
+absolute paths or as paths found by the staticfiles finders::
+
+    ENVELOPE_INLINE_IMAGES = {'robot': 'img/robot.png'}
+
+Each image is read and base64-encoded once per process. The resulting
+MIME part is attached as is to every HTML message which references it, so
+that mail clients don't have to fetch the image from a remote server.
+
+Messages with inline images are built as :class:`RelatedEmailMessage`, in
+which the images and the text and HTML alternatives share a
+``multipart/related`` part, and file attachments go next to it in the
+outer ``multipart/mixed`` part. This keeps attachments visible as such in
+mail clients.
+"""
+
+import mimetypes
+import os
+import threading
+from email.mime.image import MIMEImage
+
+from django.conf import settings as django_settings
+from django.core import mail
+from django.core.exceptions import ImproperlyConfigured
+from django.core.mail.message import SafeMIMEMultipart
+
+from envelope.settings import settings
+
+
+class RelatedEmailMessage(mail.EmailMultiAlternatives):
+    """
+    Email message with parts related to its alternatives (inline images).
+
+    The structure of the message is::
+
+        multipart/mixed
+            multipart/related
+                multipart/alternative (text, HTML)
+                related parts
+            attachments
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(RelatedEmailMessage, self).__init__(*args, **kwargs)
+        self.related_parts = []
+
+    def attach_related(self, part):
+        """
+        Adds a MIME part (such as an inline image) to the related part.
+        """
+        self.related_parts.append(part)
+
+    def _create_message(self, msg):
+        msg = self._create_alternatives(msg)
+        if self.related_parts:
+            encoding = self.encoding or django_settings.DEFAULT_CHARSET
+            related = SafeMIMEMultipart(_subtype='related', encoding=encoding)
+            related.attach(msg)
+            for part in self.related_parts:
+                related.attach(part)
+            msg = related
+        return self._create_attachments(msg)
+
+
+class InlineImage(object):
+    """
+    An image attached to messages and referenced by its Content-ID.
+
+    ``src`` is the value to use in the ``src`` attribute of an ``<img>``
+    element.
+    """
+
+    def __init__(self, name, path):
+        self.name = name
+        self.path = path
+        self.content_id = '%s@envelope' % name
+        self.src = 'cid:%s' % self.content_id
+        self.part = self.build_part()
+
+    def build_part(self):
+        mimetype = mimetypes.guess_type(self.path)[0] or ''
+        maintype, _, subtype = mimetype.partition('/')
+        if maintype != 'image':
+            raise ImproperlyConfigured(
+                "%s is not an image (ENVELOPE_INLINE_IMAGES)" % self.path
+            )
+        with open(self.path, 'rb') as f:
+            # encodes the data as base64 right away
+            part = MIMEImage(f.read(), _subtype=subtype)
+        part.add_header('Content-ID', '<%s>' % self.content_id)
+        part.add_header('Content-Disposition', 'inline',
+                        filename=os.path.basename(self.path))
+        return part
+
+
+def find_image(path):
+    """
+    Returns the absolute path of an image given in ``ENVELOPE_INLINE_IMAGES``.
+    """
+    if os.path.isabs(path):
+        return path
+    try:
+        from django.contrib.staticfiles import finders
+    except ImportError:  # pragma: no cover
+        finders = None
+    found = finders.find(path) if finders is not None else None
+    if not found:
+        raise ImproperlyConfigured(
+            "Inline image %s not found by the staticfiles finders." % path
+        )
+    return found
+
+
+_images = (None, {})
+_images_lock = threading.Lock()
+
+
+def get_inline_images():
+    """
+    Returns a dictionary mapping names to :class:`InlineImage` instances.
+    """
+    global _images
+    config = settings.INLINE_IMAGES
+    if _images[0] is not config:
+        with _images_lock:
+            if _images[0] is not config:
+                images = dict(
+                    (name, InlineImage(name, find_image(path)))
+                    for name, path in config.items()
+                )
+                _images = (config, images)
+    return _images[1]
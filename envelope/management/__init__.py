@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Helpers shared by envelope management commands.
+"""
+
+import csv
+import io
+import sys
+
+
+PY2 = sys.version_info[0] == 2
+
+
+def _decode(value):
+    if isinstance(value, bytes):
+        return value.decode('utf-8')
+    if isinstance(value, list):  # extra values of a row that is too long
+        return [_decode(item) for item in value]
+    return value
+
+
+def read_csv(path):
+    """
+    Yields the rows of a UTF-8 encoded CSV file as dictionaries.
+
+    The file is read as a stream. On Python 2, where the ``csv`` module
+    can't handle unicode input, the file is parsed as bytes and every
+    cell is decoded separately.
+    """
+    if PY2:
+        with open(path, 'rb') as f:
+            for row in csv.DictReader(f):
+                yield dict((_decode(k), _decode(v)) for k, v in row.items())
+    else:
+        with io.open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                yield row
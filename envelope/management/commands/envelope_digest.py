@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Sends digests of messages stored by the digest delivery backend.
+"""
+
+from django.core.management.base import BaseCommand
+
+from envelope.delivery import DigestBackend
+
+
+class Command(BaseCommand):
+    help = "Sends contact form messages stored by DigestBackend as digests."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-messages', type=int, default=None,
+            help="Maximum number of messages in a single digest.",
+        )
+
+    def handle(self, *args, **options):
+        backend = DigestBackend()
+        digests, messages = backend.flush(options['max_messages'])
+        self.stdout.write(
+            "Sent %d messages in %d digests" % (messages, digests)
+        )
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Sends messages waiting in the envelope spool.
+"""
+
+from django.core.management.base import BaseCommand
+
+from envelope.delivery import SpoolBackend
+
+
+class Command(BaseCommand):
+    help = "Sends contact form messages waiting in ENVELOPE_SPOOL_DIR."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=None,
+            help="Number of messages read from the spool at a time.",
+        )
+
+    def handle(self, *args, **options):
+        backend = SpoolBackend()
+        sent, deferred, failed = backend.flush(options['batch_size'])
+        self.stdout.write(
+            "Sent: %d, deferred: %d, failed: %d" % (sent, deferred, failed)
+        )
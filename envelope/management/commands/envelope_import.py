@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Sends contact messages imported from CSV files.
+"""
+
+from django.core.management.base import BaseCommand
+from django.utils.module_loading import import_string
+
+from envelope.management import read_csv
+
+
+class Command(BaseCommand):
+    help = (
+        "Validates and sends contact messages from CSV files with a column "
+        "for each form field (e.g. 'sender', 'email', 'subject' and "
+        "'message'). Files are read as a stream, so they can be of any size."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="CSV files to import.")
+        parser.add_argument(
+            '--form-class', default='envelope.forms.ContactForm',
+            help="Form class used to validate and send the messages.",
+        )
+
+    def handle(self, *args, **options):
+        form_class = import_string(options['form_class'])
+        forms = (form_class(row) for row in self.read(options['files']))
+        sent, failed, invalid, duplicates = form_class.save_many(forms)
+        self.stdout.write(
+            "Sent: %d, failed: %d, invalid: %d, duplicates: %d"
+            % (sent, failed, invalid, duplicates)
+        )
+
+    def read(self, paths):
+        for path in paths:
+            for row in read_csv(path):
+                yield row
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Trains the content spam classifier from labelled messages.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from envelope.classifier import Trainer
+from envelope.management import read_csv
+from envelope.settings import settings
+
+
+class Command(BaseCommand):
+    help = (
+        "Trains the spam classifier from CSV files with 'label', 'subject' "
+        "and 'message' columns. Rows labelled 'spam' are spam, all other "
+        "rows are legitimate messages."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+', help="Labelled CSV exports.")
+        parser.add_argument(
+            '--output', default=None,
+            help="Model file to write (defaults to ENVELOPE_CLASSIFIER_MODEL).",
+        )
+        parser.add_argument(
+            '--buckets', type=int, default=2 ** 18,
+            help="Number of hash buckets in the model.",
+        )
+
+    def handle(self, *args, **options):
+        output = options['output'] or settings.CLASSIFIER_MODEL
+        if not output:
+            raise CommandError(
+                "Use --output or set ENVELOPE_CLASSIFIER_MODEL."
+            )
+        trainer = Trainer(buckets=options['buckets'])
+        for path in options['files']:
+            for row in read_csv(path):
+                text = '%s\n%s' % (row.get('subject') or '',
+                                   row.get('message') or '')
+                is_spam = (row.get('label') or '').strip() == 'spam'
+                trainer.add(text, is_spam)
+        trainer.save(output)
+        self.stdout.write(
+            "Trained on %d spam and %d legitimate messages, saved to %s" % (
+                trainer.spam_total, trainer.ham_total, output,
+            )
+        )
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Timing and counters of the contact form processing stages.
+
+Envelope reports the following metrics, if ``ENVELOPE_METRICS_BACKEND``
+is set:
+
+``before_send`` (timing)
+    Time spent in ``before_send`` signal receivers.
+
+``spam_filter`` (timing, label ``filter``)
+    Time spent in each spam filter.
+
+``render`` (timing)
+    Time spent rendering the email message.
+
+``send`` (timing)
+    Time spent sending the message to the mail server.
+
+``rejected`` (counter, label ``receiver``)
+    Messages rejected by a ``before_send`` receiver.
+
+``spam`` (counter, label ``filter``)
+    Messages rejected by a spam filter.
+
+``throttled`` (counter)
+    Requests rejected by rate limiting.
+
+``sent`` and ``send_failed`` (counters)
+    Messages sent successfully and messages which could not be sent.
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from django.http import HttpResponse
+from django.utils.module_loading import import_string
+
+from envelope.settings import settings
+
+
+logger = logging.getLogger('envelope.metrics')
+
+timer = getattr(time, 'perf_counter', time.time)
+
+
+class BaseMetrics(object):
+    """
+    Base class for metrics backends.
+    """
+
+    def timing(self, name, seconds, **labels):
+        raise NotImplementedError
+
+    def increment(self, name, value=1, **labels):
+        raise NotImplementedError
+
+
+class StatsdMetrics(BaseMetrics):
+    """
+    Sends metrics to a StatsD server over UDP.
+
+    Label values are appended to the metric name, e.g.
+    ``envelope.spam.check_honeypot``. The server address is taken from
+    ``ENVELOPE_STATSD_HOST`` and ``ENVELOPE_STATSD_PORT``.
+    """
+
+    def __init__(self, host=None, port=None, prefix='envelope'):
+        self.address = (host or settings.STATSD_HOST,
+                        port or settings.STATSD_PORT)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def timing(self, name, seconds, **labels):
+        # fractional milliseconds, so that fast stages don't report zero
+        self.send(name, labels, '%.3f|ms' % (seconds * 1000))
+
+    def increment(self, name, value=1, **labels):
+        self.send(name, labels, '%d|c' % value)
+
+    def send(self, name, labels, value):
+        parts = [self.prefix, name] + [labels[k] for k in sorted(labels)]
+        line = '%s:%s' % ('.'.join(parts), value)
+        try:
+            self.socket.sendto(line.encode('utf-8'), self.address)
+        except socket.error:
+            logger.debug("Could not send metric %s", line)
+
+
+class PrometheusMetrics(BaseMetrics):
+    """
+    Collects metrics in memory and exposes them in the Prometheus text format.
+
+    Hook :func:`metrics_view` into your URLconf to let Prometheus scrape
+    them. Each process keeps its own numbers.
+    """
+
+    def __init__(self):
+        self.counters = {}
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def timing(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            count, total = self.timings.get(key, (0, 0.0))
+            self.timings[key] = (count + 1, total + seconds)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def render(self):
+        """
+        Returns the metrics in the Prometheus text exposition format.
+        """
+        lines = []
+        with self.lock:
+            timings = sorted(self.timings.items())
+            counters = sorted(self.counters.items())
+        for (name, labels), (count, total) in timings:
+            metric = 'envelope_%s_seconds' % name
+            lines.append('%s_count%s %d' % (metric, format_labels(labels),
+                                            count))
+            lines.append('%s_sum%s %r' % (metric, format_labels(labels),
+                                          total))
+        for (name, labels), value in counters:
+            lines.append('envelope_%s_total%s %d' % (
+                name, format_labels(labels), value,
+            ))
+        return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(
+        '%s="%s"' % (key, value.replace('\\', '\\\\').replace('"', '\\"'))
+        for key, value in labels
+    )
+
+
+_backends = {}
+
+
+def get_metrics():
+    """
+    Returns the metrics backend, or ``None`` if metrics are disabled.
+    """
+    path = settings.METRICS_BACKEND
+    if not path:
+        return None
+    try:
+        return _backends[path]
+    except KeyError:
+        return _backends.setdefault(path, import_string(path)())
+
+
+def metrics_view(request):
+    """
+    Exposes the metrics collected by :class:`PrometheusMetrics`.
+    """
+    metrics = get_metrics()
+    content = metrics.render() if hasattr(metrics, 'render') else ''
+    return HttpResponse(content, content_type='text/plain; version=0.0.4')
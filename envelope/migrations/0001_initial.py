@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContactMessage',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created')),
+                ('sender', models.CharField(max_length=255, verbose_name='From')),
+                ('email', models.EmailField(max_length=254, verbose_name='Email')),
+                ('subject', models.CharField(blank=True, max_length=255, verbose_name='Subject')),
+                ('message', models.TextField(verbose_name='Message')),
+                ('status', models.CharField(choices=[('accepted', 'Accepted'), ('failed', 'Failed'), ('rejected', 'Rejected')], default='accepted', max_length=10, verbose_name='Status')),
+            ],
+            options={
+                'verbose_name': 'contact message',
+                'verbose_name_plural': 'contact messages',
+                'ordering': ('-id',),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['created'], name='envelope_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['email'], name='envelope_email_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactmessage',
+            index=models.Index(fields=['status', 'created'], name='envelope_status_idx'),
+        ),
+    ]
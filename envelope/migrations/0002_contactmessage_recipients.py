@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('envelope', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactmessage',
+            name='recipients',
+            field=models.TextField(blank=True, verbose_name='Recipients'),
+        ),
+        migrations.AlterField(
+            model_name='contactmessage',
+            name='status',
+            field=models.CharField(choices=[('accepted', 'Accepted'), ('failed', 'Failed'), ('rejected', 'Rejected'), ('pending', 'Waiting for digest')], default='accepted', max_length=10, verbose_name='Status'),
+        ),
+    ]
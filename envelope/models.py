@@ -1 +1,62 @@
-# nothing here, move on
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Optional archive of contact form submissions.
+
+The table is only written to if ``ENVELOPE_ARCHIVE`` is enabled
+(see :mod:`envelope.archive`), or by ``DigestBackend``, which keeps
+messages there until they are sent in a digest.
+"""
+
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+try:
+    from django.utils.encoding import python_2_unicode_compatible
+except ImportError:  # pragma: no cover
+    def python_2_unicode_compatible(cls):
+        return cls
+
+
+@python_2_unicode_compatible
+class ContactMessage(models.Model):
+    """
+    A single contact form submission.
+    """
+    ACCEPTED = 'accepted'
+    FAILED = 'failed'
+    REJECTED = 'rejected'
+    PENDING = 'pending'
+    STATUS_CHOICES = (
+        (ACCEPTED, _("Accepted")),
+        (FAILED, _("Failed")),
+        (REJECTED, _("Rejected")),
+        (PENDING, _("Waiting for digest")),
+    )
+
+    created = models.DateTimeField(_("Created"), default=timezone.now)
+    sender = models.CharField(_("From"), max_length=255)
+    email = models.EmailField(_("Email"), max_length=254)
+    subject = models.CharField(_("Subject"), max_length=255, blank=True)
+    message = models.TextField(_("Message"))
+    status = models.CharField(_("Status"), max_length=10,
+                              choices=STATUS_CHOICES, default=ACCEPTED)
+    recipients = models.TextField(_("Recipients"), blank=True)
+    body = models.TextField(_("Rendered message"), blank=True)
+
+    class Meta:
+        verbose_name = _("contact message")
+        verbose_name_plural = _("contact messages")
+        ordering = ('-id',)
+        indexes = [
+            models.Index(fields=['created'], name='envelope_created_idx'),
+            models.Index(fields=['email'], name='envelope_email_idx'),
+            models.Index(fields=['status', 'created'],
+                         name='envelope_status_idx'),
+        ]
+
+    def __str__(self):
+        return '%s <%s>: %s' % (self.sender, self.email, self.subject)
@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Rate limiting of contact form submissions.
+"""
+
+import hashlib
+import time
+
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.module_loading import import_string
+
+from envelope.cache import TTLCache, get_cache
+from envelope.duplicates import normalize
+from envelope.settings import settings
+
+
+PERIODS = {
+    's': 1,
+    'm': 60,
+    'h': 60 * 60,
+    'd': 24 * 60 * 60,
+}
+
+
+def parse_rate(rate):
+    """
+    Parses a rate such as ``"5/m"`` into a ``(limit, period)`` tuple.
+    """
+    try:
+        limit, period = rate.split('/')
+        return int(limit), PERIODS[period.strip()[0]]
+    except (ValueError, KeyError, IndexError):
+        raise ImproperlyConfigured("Invalid rate: %r" % rate)
+
+
+class BaseRateLimiter(object):
+    """
+    Base class for rate limiters.
+    """
+
+    def __init__(self, limit, period):
+        self.limit = limit
+        self.period = period
+
+    def hit(self, key, now=None):
+        """
+        Registers a request identified by ``key``.
+
+        Returns ``None`` if the request is allowed, otherwise the number of
+        seconds after which the client may try again.
+        """
+        raise NotImplementedError
+
+
+class LocalRateLimiter(BaseRateLimiter):
+    """
+    Token bucket rate limiter kept in the memory of the current process.
+
+    Buckets expire once they would have been refilled completely. At most
+    ``max_keys`` buckets are kept; when there are more clients, the least
+    recently used bucket is dropped, which is the same as refilling it.
+    Concurrent requests with the same key may occasionally let one more
+    request through than the limit allows.
+    """
+
+    max_keys = 10000
+
+    def __init__(self, limit, period):
+        super(LocalRateLimiter, self).__init__(limit, period)
+        self.rate = float(limit) / period
+        self.buckets = TTLCache(max_size=self.max_keys)
+
+    def hit(self, key, now=None):
+        if now is None:
+            now = time.time()
+        tokens, updated = self.buckets.get(key, (self.limit, now), now=now)
+        tokens = min(self.limit, tokens + (now - updated) * self.rate)
+        if tokens < 1:
+            self.buckets.set(key, (tokens, now), self.period, now=now)
+            return (1 - tokens) / self.rate
+        self.buckets.set(key, (tokens - 1, now), self.period, now=now)
+        return None
+
+
+class CacheRateLimiter(BaseRateLimiter):
+    """
+    Sliding window rate limiter shared through the Django cache.
+
+    Requests are counted in fixed windows and the count from the previous
+    window is weighted by how much of it still overlaps the sliding window.
+    Use a cache shared by all processes (e.g. memcached or Redis) to
+    apply the limit across servers.
+    """
+
+    def hit(self, key, now=None):
+        if now is None:
+            now = time.time()
+        cache = get_cache()
+        window = int(now // self.period)
+        elapsed = now - window * self.period
+        current_key = 'envelope:ratelimit:%s:%d' % (key, window)
+        previous_key = 'envelope:ratelimit:%s:%d' % (key, window - 1)
+        cache.add(current_key, 0, self.period * 2)
+        try:
+            current = cache.incr(current_key)
+        except ValueError:  # expired in the meantime
+            cache.add(current_key, 1, self.period * 2)
+            current = 1
+        previous = cache.get(previous_key, 0)
+        weight = 1 - elapsed / float(self.period)
+        if previous * weight + current > self.limit:
+            # rejected requests don't count towards the limit
+            try:
+                cache.decr(current_key)
+            except ValueError:
+                pass
+            return self.period - elapsed
+        return None
+
+
+def get_rate_limit_key(request):
+    """
+    Returns the key which identifies the client (``ENVELOPE_RATELIMIT_KEY``).
+
+    Email addresses are hashed, as they come from the client unvalidated
+    and may contain characters which are not allowed in cache keys.
+    """
+    key_type = settings.RATELIMIT_KEY
+    if key_type == 'email':
+        email = normalize(request.POST.get('email', ''))
+        return 'email:%s' % hashlib.sha1(email.encode('utf-8')).hexdigest()
+    user = getattr(request, 'user', None)
+    if key_type == 'user' and user is not None and user.is_authenticated:
+        return 'user:%s' % user.pk
+    return 'ip:%s' % request.META.get('REMOTE_ADDR', '')
+
+
+_limiters = {}
+
+
+def get_rate_limiter():
+    """
+    Returns the rate limiter configured in the settings.
+
+    Returns ``None`` if ``ENVELOPE_RATELIMIT`` is not set.
+    """
+    if not settings.RATELIMIT:
+        return None
+    config = (settings.RATELIMIT_BACKEND, settings.RATELIMIT)
+    try:
+        return _limiters[config]
+    except KeyError:
+        limit, period = parse_rate(settings.RATELIMIT)
+        limiter = import_string(settings.RATELIMIT_BACKEND)(limit, period)
+        return _limiters.setdefault(config, limiter)
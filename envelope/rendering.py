@@ -0,0 +1,219 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Rendering of email message templates.
+"""
+
+import os
+import re
+import threading
+
+from django.conf import settings as django_settings
+from django.template import engines
+from django.template.base import TextNode
+from django.template.loader import get_template, select_template
+
+from envelope.settings import settings
+
+try:
+    string_types = basestring
+except NameError:  # Python 3
+    string_types = str
+
+
+class TemplateCache(object):
+    """
+    Keeps compiled email templates for the lifetime of the process.
+
+    Templates are keyed by the list of template names they were selected
+    from. A cached template is compiled again if its source file was
+    modified in the meantime, and caching is skipped altogether when
+    ``DEBUG`` is on. The ``hits`` and ``misses`` counters show how well
+    the cache performs.
+    """
+
+    def __init__(self):
+        self.templates = {}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get_template(self, template_name):
+        """
+        Returns a compiled template, given a name or a list of names.
+        """
+        if isinstance(template_name, string_types):
+            key = (template_name,)
+        else:
+            key = tuple(template_name)
+        if django_settings.DEBUG:
+            return self.load(key)
+        cached = self.templates.get(key)
+        if cached is not None:
+            template, path, mtime = cached
+            if path is None or _get_mtime(path) == mtime:
+                self.hits += 1
+                return template
+            _reset_cached_loaders()
+        template = self.load(key)
+        path = _get_origin(template)
+        mtime = _get_mtime(path) if path else None
+        if mtime is None:
+            path = None
+        with self.lock:
+            self.misses += 1
+            self.templates[key] = (template, path, mtime)
+        return template
+
+    def load(self, key):
+        if len(key) == 1:
+            template = get_template(key[0])
+        else:
+            template = select_template(key)
+        if settings.MINIFY_HTML and _get_name(template).endswith('.html'):
+            template = minify_template(template)
+        return template
+
+    def render(self, template_name, context):
+        """
+        Renders the template with a dictionary of variables.
+        """
+        return self.get_template(template_name).render(context)
+
+    def clear(self):
+        with self.lock:
+            self.templates.clear()
+            self.hits = self.misses = 0
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        return float(self.hits) / total if total else 0.0
+
+
+COMMENT_RE = re.compile(r'<!--(?!\[if|<!|>).*?-->', re.DOTALL)
+STYLE_ATTR_RE = re.compile(r'(\sstyle=)"([^"{}]*)"', re.IGNORECASE)
+STYLE_BLOCK_RE = re.compile(r'(<style[^>]*>)(.*?)(</style>)',
+                            re.DOTALL | re.IGNORECASE)
+CSS_COMMENT_RE = re.compile(r'/\*.*?\*/', re.DOTALL)
+CSS_SPACE_RE = re.compile(r'\s*([{};,])\s*|(:)\s+')
+WHITESPACE_RE = re.compile(r'\s+')
+PRESERVE_RE = re.compile(r'<(pre|textarea)\b', re.IGNORECASE)
+# a semicolon inside parentheses or quotes doesn't end the declaration
+DECLARATION_RE = re.compile(r'''(?:\([^)]*\)|'[^']*'|"[^"]*"|[^;])+''')
+
+
+def _minify_declarations(style):
+    # repeated properties are kept, as email templates use them to provide
+    # fallbacks for clients which don't understand the later value
+    declarations = []
+    for declaration in DECLARATION_RE.findall(style):
+        name, colon, value = declaration.partition(':')
+        name = name.strip().lower()
+        if colon and name:
+            declarations.append('%s:%s' % (name, ' '.join(value.split())))
+    return ';'.join(declarations)
+
+
+def _minify_style_block(match):
+    css = CSS_COMMENT_RE.sub('', match.group(2))
+    css = CSS_SPACE_RE.sub(lambda m: m.group(1) or m.group(2), css.strip())
+    return match.group(1) + css + match.group(3)
+
+
+def _collapse_whitespace(match):
+    return '\n' if '\n' in match.group(0) else ' '
+
+
+def minify_html(html):
+    """
+    Makes HTML email markup smaller without changing how it is displayed.
+
+    Comments (except conditional ones) are removed, runs of whitespace are
+    collapsed to a single character, and CSS in ``style`` attributes and
+    elements is written without redundant whitespace. Newlines are kept, so that lines stay short enough for SMTP.
+    """
+    html = COMMENT_RE.sub('', html)
+    html = STYLE_BLOCK_RE.sub(_minify_style_block, html)
+    html = STYLE_ATTR_RE.sub(
+        lambda m: '%s"%s"' % (m.group(1), _minify_declarations(m.group(2))),
+        html,
+    )
+    return WHITESPACE_RE.sub(_collapse_whitespace, html)
+
+
+def _iter_text_nodes(nodelist):
+    for node in nodelist:
+        if isinstance(node, TextNode):
+            yield node
+        for attr in getattr(node, 'child_nodelists', ()):
+            for child in _iter_text_nodes(getattr(node, attr, None) or []):
+                yield child
+
+
+def minify_template(template):
+    """
+    Returns a copy of the compiled template with minified static parts.
+
+    Only the literal markup of the template is changed, so the cost is
+    paid once, when the template is compiled, and every message rendered
+    from it is smaller. Templates containing ``<pre>`` or ``<textarea>``
+    elements are returned unchanged, as whitespace is significant there.
+
+    The template is compiled again from its source, because the original
+    may be shared by Django's cached template loader.
+    """
+    inner = getattr(template, 'template', template)
+    if PRESERVE_RE.search(inner.source):
+        return template
+    minified = inner.__class__(inner.source, inner.origin, inner.name,
+                               inner.engine)
+    for node in _iter_text_nodes(minified.nodelist):
+        node.s = minify_html(node.s)
+    if inner is template:
+        return minified
+    return template.__class__(minified, template.backend)
+
+
+def _get_name(template):
+    template = getattr(template, 'template', template)
+    return getattr(template, 'name', None) or ''
+
+
+def _get_origin(template):
+    """
+    Returns the file name the template was loaded from, if known.
+    """
+    template = getattr(template, 'template', template)
+    origin = getattr(template, 'origin', None)
+    return getattr(origin, 'name', None)
+
+
+def _reset_cached_loaders():
+    """
+    Makes Django's cached template loaders forget the stale template.
+    """
+    for backend in engines.all():
+        engine = getattr(backend, 'engine', None)
+        for loader in getattr(engine, 'template_loaders', []):
+            if hasattr(loader, 'reset'):
+                loader.reset()
+
+
+def _get_mtime(path):
+    try:
+        return os.stat(path).st_mtime
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+template_cache = TemplateCache()
+
+
+def render_email(template_name, context):
+    """
+    Renders an email template using the shared template cache.
+    """
+    return template_cache.render(template_name, context)
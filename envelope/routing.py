@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Routing of messages to recipients based on their content.
+
+``ENVELOPE_ROUTES`` is a list of rules. Each rule is a dictionary with
+a ``recipients`` list and at least one of the following keys:
+
+``category``
+    Value (or list of values) of the form's ``category`` field.
+
+``subject``
+    Regular expression searched for in the subject.
+
+``keywords``
+    List of words searched for in the subject and the message body.
+
+For example::
+
+    ENVELOPE_ROUTES = [
+        {'category': 'billing', 'recipients': ['billing@example.com']},
+        {'subject': r'^\\[bug\\]', 'recipients': ['dev@example.com']},
+        {'keywords': ['refund', 'invoice'],
+         'recipients': ['billing@example.com']},
+    ]
+
+The message goes to the recipients of every matching rule. If no rule
+matches, the form's ``email_recipients`` are used.
+
+All subject patterns and all keywords are compiled into one regular
+expression each, so routing does a single pass over the text no matter
+how many rules there are; the patterns are then tried one by one only at
+the positions where that expression found a match, so overlapping matches
+(``refund`` and ``refund request``) are all seen. Matching is
+case-insensitive. Because the patterns are combined, they must not use
+numbered backreferences.
+"""
+
+import re
+
+from django.core.exceptions import ImproperlyConfigured
+
+from envelope.settings import settings
+
+
+# Python 2 doesn't allow more than 100 groups in a regular expression
+MAX_GROUPS = 99
+
+FLAGS = re.IGNORECASE | re.UNICODE
+
+
+def combine(parts):
+    # a lookahead doesn't consume the text, so matches starting inside
+    # other matches are found as well
+    return re.compile('(?=%s)' % '|'.join('(?:%s)' % p for p in parts), FLAGS)
+
+
+def compile_patterns(patterns):
+    """
+    Combines ``(pattern, rules)`` pairs into as few regular expressions as
+    possible.
+
+    Returns a list of ``(regex, patterns)`` pairs, where ``regex`` finds
+    the positions at which any of the ``patterns`` (a list of compiled
+    pattern and rules pairs) match.
+    """
+    matchers = []
+    parts, compiled, count = [], [], 0
+    for pattern, rules in patterns:
+        try:
+            regex = re.compile(pattern, FLAGS)
+        except re.error as e:
+            raise ImproperlyConfigured(
+                "Invalid pattern %r in ENVELOPE_ROUTES: %s" % (pattern, e)
+            )
+        if parts and count + regex.groups > MAX_GROUPS:
+            matchers.append((combine(parts), compiled))
+            parts, compiled, count = [], [], 0
+        parts.append(pattern)
+        compiled.append((regex, rules))
+        count += regex.groups
+    if parts:
+        matchers.append((combine(parts), compiled))
+    return matchers
+
+
+class Router(object):
+    """
+    Finds recipients for a message using precompiled routing rules.
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.categories = {}
+        subjects = []
+        keywords = {}
+        for index, route in enumerate(routes):
+            if 'recipients' not in route:
+                raise ImproperlyConfigured(
+                    "Every rule in ENVELOPE_ROUTES needs recipients."
+                )
+            if not any(key in route for key in
+                       ('category', 'subject', 'keywords')):
+                raise ImproperlyConfigured(
+                    "Every rule in ENVELOPE_ROUTES needs a category, "
+                    "subject or keywords to match."
+                )
+            category = route.get('category')
+            if category is not None:
+                if not isinstance(category, (list, tuple)):
+                    category = [category]
+                for value in category:
+                    self.categories.setdefault(value, []).append(index)
+            if 'subject' in route:
+                subjects.append((route['subject'], [index]))
+            for keyword in route.get('keywords', ()):
+                # the same keyword may appear in several rules
+                keywords.setdefault(keyword.lower(), []).append(index)
+        self.subject_matchers = compile_patterns(subjects)
+        self.keyword_matchers = compile_patterns(
+            (r'(?<!\w)%s(?!\w)' % re.escape(keyword), rules)
+            for keyword, rules in sorted(keywords.items())
+        )
+
+    def route(self, data):
+        """
+        Returns the recipients for the cleaned form data, or ``None`` if no
+        rule matches.
+        """
+        matched = set(self.categories.get(data.get('category'), ()))
+        subject = data.get('subject') or ''
+        self.search(self.subject_matchers, subject, matched)
+        if self.keyword_matchers:
+            text = '%s\n%s' % (subject, data.get('message') or '')
+            self.search(self.keyword_matchers, text, matched)
+        if not matched:
+            return None
+        recipients = []
+        for index in sorted(matched):
+            for recipient in self.routes[index]['recipients']:
+                if recipient not in recipients:
+                    recipients.append(recipient)
+        return recipients
+
+    def search(self, matchers, text, matched):
+        for regex, patterns in matchers:
+            for match in regex.finditer(text):
+                position = match.start()
+                for pattern, rules in patterns:
+                    if (not matched.issuperset(rules) and
+                            pattern.match(text, position)):
+                        matched.update(rules)
+
+
+_router = (None, None)
+
+
+def get_router():
+    """
+    Returns the router built from ``ENVELOPE_ROUTES``, or ``None`` if no
+    routes are configured.
+    """
+    global _router
+    routes = settings.ROUTES
+    if not routes:
+        return None
+    if _router[0] is not routes:
+        _router = (routes, Router(routes))
+    return _router[1]
@@ -4,18 +4,126 @@ from __future__ import unicode_literals
 
 """
 Defaults and overrides for envelope-related settings.
+
+The values are looked up in the project settings on first access and cached
+afterwards. The cache is cleared whenever a setting changes (for example
+with ``override_settings`` in tests), so importing this module does not
+require the settings to be configured.
 """
 
-from django.conf import settings
+from django.conf import settings as django_settings
+from django.core.signals import setting_changed
 from django.utils.translation import ugettext_lazy as _
 
 
-FROM_EMAIL = settings.DEFAULT_FROM_EMAIL
+DEFAULTS = {
+    'SUBJECT_INTRO': _("Message from contact form: "),
+    'USE_HTML_EMAIL': True,
+    'HTML_FROM_TEXT': False,
+    'DELIVERY_BACKEND': 'envelope.delivery.ImmediateBackend',
+    'DELIVERY_THREADS': 2,
+    'DELIVERY_QUEUE_SIZE': 1000,
+    'SPOOL_DIR': None,
+    'SPOOL_BATCH_SIZE': 100,
+    'SPOOL_MAX_ATTEMPTS': 5,
+    'SPOOL_RETRY_DELAY': 60,
+    'BATCH_SIZE': 50,
+    'BATCH_TIMEOUT': 5,
+    'CONNECTION_POOL_SIZE': 0,
+    'CONNECTION_MAX_IDLE': 30,
+    'CONNECTION_POOL_TIMEOUT': 10,
+    'CACHE_ALIAS': 'default',
+    'FORM_CACHE_TIMEOUT': None,
+    'SPAM_FILTERS': ['envelope.spam_filters.check_honeypot'],
+    'RATELIMIT': None,
+    'RATELIMIT_BACKEND': 'envelope.ratelimit.LocalRateLimiter',
+    'RATELIMIT_KEY': 'ip',
+    'DUPLICATE_WINDOW': None,
+    'DUPLICATE_CACHE': 'local',
+    'DUPLICATE_CACHE_SIZE': 1000,
+    'CLASSIFIER_MODEL': None,
+    'CLASSIFIER_THRESHOLD': 0.9,
+    'PARALLEL_BEFORE_SEND': False,
+    'BEFORE_SEND_TIMEOUT': 5,
+    'BEFORE_SEND_THREADS': 10,
+    'BEFORE_SEND_QUEUE_SIZE': 100,
+    'VERIFY_EMAIL_DOMAIN': False,
+    'DNS_NAMESERVERS': [],
+    'DNS_PORT': 53,
+    'DNS_TIMEOUT': 2,
+    'DNS_CACHE_TTL': 60 * 60,
+    'DNS_NEGATIVE_TTL': 5 * 60,
+    'METRICS_BACKEND': None,
+    'STATSD_HOST': '127.0.0.1',
+    'STATSD_PORT': 8125,
+    'ARCHIVE': False,
+    'ARCHIVE_BATCH_SIZE': 100,
+    'ARCHIVE_FLUSH_INTERVAL': 5,
+    'DIGEST_MAX_MESSAGES': 500,
+    'ROUTES': [],
+    'MINIFY_HTML': False,
+    'INLINE_IMAGES': {},
+    'ATTACHMENT_MAX_FILES': 5,
+    'ATTACHMENT_MAX_SIZE': 5 * 1024 * 1024,
+    'ATTACHMENT_MAX_TOTAL_SIZE': 10 * 1024 * 1024,
+    'ATTACHMENT_TYPES': [
+        'image/png', 'image/jpeg', 'image/gif', 'image/webp',
+        'application/pdf', 'text/plain',
+    ],
+}
+
+
+class EnvelopeSettings(object):
+    """
+    Lazily evaluated envelope settings.
+
+    ``settings.SUBJECT_INTRO`` returns the value of ``ENVELOPE_SUBJECT_INTRO``
+    from the project settings, or the default if it isn't set.
+    """
+
+    def __getattr__(self, name):
+        if name == 'FROM_EMAIL':
+            value = django_settings.DEFAULT_FROM_EMAIL
+        elif name == 'EMAIL_RECIPIENTS':
+            value = getattr(django_settings, 'ENVELOPE_EMAIL_RECIPIENTS',
+                            [django_settings.DEFAULT_FROM_EMAIL])
+        elif name in DEFAULTS:
+            value = getattr(django_settings, 'ENVELOPE_' + name,
+                            DEFAULTS[name])
+        else:
+            raise AttributeError(name)
+        # cache the value, so that __getattr__ isn't called next time
+        self.__dict__[name] = value
+        return value
+
+    def reload(self):
+        """
+        Forgets all cached values.
+        """
+        self.__dict__.clear()
+
+
+settings = EnvelopeSettings()
+
+
+class LazySetting(object):
+    """
+    Class attribute which evaluates to the current value of a setting.
+
+    The attribute can still be overridden in a subclass or on an instance.
+    """
+
+    def __init__(self, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        return getattr(settings, self.name)
+
 
-EMAIL_RECIPIENTS = getattr(settings, 'ENVELOPE_EMAIL_RECIPIENTS',
-                           [settings.DEFAULT_FROM_EMAIL])
+def reload_settings(setting, **kwargs):
+    if setting.startswith('ENVELOPE_') or setting == 'DEFAULT_FROM_EMAIL':
+        settings.reload()
 
-SUBJECT_INTRO = getattr(settings, 'ENVELOPE_SUBJECT_INTRO',
-                        _("Message from contact form: "))
 
-USE_HTML_EMAIL = getattr(settings, 'ENVELOPE_USE_HTML_EMAIL', True)
+setting_changed.connect(reload_settings,
+                        dispatch_uid='envelope.settings.reload_settings')
@@ -6,7 +6,181 @@ from __future__ import unicode_literals
 Signals sent by the application.
 """
 
+import logging
+import threading
+import time
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+from django.db import close_old_connections
 from django.dispatch import Signal
 
+from envelope.settings import settings
+
+
+logger = logging.getLogger('envelope.signals')
+
+throttle = Signal(providing_args=["request"])
 before_send = Signal(providing_args=["request", "form"])
 after_send = Signal(providing_args=["message", "form"])
+
+
+def get_live_receivers(signal, sender):
+    """
+    Returns the receivers of the signal for the given sender.
+
+    Django has no public API to list receivers without calling them, so
+    this relies on the private ``Signal._live_receivers()``, which
+    ``Signal.send()`` itself uses. Keep every use of it here.
+    """
+    receivers = signal._live_receivers(sender)
+    if isinstance(receivers, tuple):
+        # Django 5.0+ returns (sync_receivers, async_receivers)
+        receivers = receivers[0]
+    return list(receivers)
+
+
+class ReceiverPool(object):
+    """
+    A pool of threads calling signal receivers.
+
+    The pool lives for the whole process. Its size and the number of
+    calls waiting for a free thread are limited by
+    ``ENVELOPE_BEFORE_SEND_THREADS`` and ``ENVELOPE_BEFORE_SEND_QUEUE_SIZE``.
+    If the queue is full, receivers are called in the current thread
+    instead.
+    """
+
+    def __init__(self, threads=None, queue_size=None):
+        if threads is None:
+            threads = settings.BEFORE_SEND_THREADS
+        if queue_size is None:
+            queue_size = settings.BEFORE_SEND_QUEUE_SIZE
+        self.threads = threads
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def submit(self, call):
+        """
+        Schedules ``call()`` to run in one of the threads.
+        """
+        self.start()
+        try:
+            self.queue.put_nowait(call)
+        except queue.Full:
+            logger.warning("Receiver queue is full, calling synchronously")
+            call()
+
+    def start(self):
+        """
+        Starts the worker threads, unless they are already running.
+        """
+        if len(self.workers) >= self.threads:
+            return
+        with self.lock:
+            while len(self.workers) < self.threads:
+                worker = threading.Thread(
+                    target=self.work,
+                    name='envelope-receiver-%d' % len(self.workers),
+                )
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+
+    def work(self):
+        """
+        Worker thread loop: runs calls as they appear in the queue.
+        """
+        while True:
+            call = self.queue.get()
+            try:
+                call()
+            except Exception:
+                logger.exception("Unexpected error in the receiver thread")
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def join(self):
+        """
+        Blocks until all submitted calls have been processed.
+        """
+        self.queue.join()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_receiver_pool():
+    """
+    Returns the process-wide pool of receiver threads.
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ReceiverPool()
+    return _pool
+
+
+def send_concurrently(signal, sender, timeout, **named):
+    """
+    Calls all receivers of the signal at the same time, using the threads
+    of the shared :class:`ReceiverPool`.
+
+    Returns a list of ``(receiver, response)`` pairs in the order in which
+    the responses arrived. Stops waiting as soon as a receiver returns
+    a false value, or when ``timeout`` seconds have passed. Receivers which
+    did not respond in time (including those which never got a thread) are
+    listed with a ``None`` response, so that a busy pool can't be used to
+    skip spam filters; receivers which have not started yet are not called
+    anymore. Exceptions raised by receivers propagate like with
+    ``Signal.send()``.
+    """
+    receivers = get_live_receivers(signal, sender)
+    results = queue.Queue()
+    done = threading.Event()
+
+    def make_call(receiver):
+        def call():
+            if done.is_set():
+                return
+            try:
+                response = receiver(signal=signal, sender=sender, **named)
+            except Exception as e:
+                results.put((receiver, None, e))
+            else:
+                results.put((receiver, response, None))
+        return call
+
+    pool = get_receiver_pool()
+    for receiver in receivers:
+        pool.submit(make_call(receiver))
+    deadline = time.time() + timeout
+    responses = []
+    try:
+        while len(responses) < len(receivers):
+            try:
+                receiver, response, error = results.get(
+                    timeout=max(deadline - time.time(), 0)
+                )
+            except queue.Empty:
+                responded = set(id(r) for (r, response) in responses)
+                late = [r for r in receivers if id(r) not in responded]
+                logger.warning("%d receiver(s) did not respond in time",
+                               len(late))
+                responses.extend((r, None) for r in late)
+                break
+            if error is not None:
+                raise error
+            responses.append((receiver, response))
+            if not response:
+                break
+    finally:
+        done.set()
+    return responses
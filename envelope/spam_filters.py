@@ -4,9 +4,42 @@ from __future__ import unicode_literals
 
 """
 Functions that reject the message if it is considered spam.
+
+Every spam filter is a function which takes the current request and the
+(valid) form, and returns ``False`` if the message should be rejected.
+Filters are run by a :class:`SpamFilterPipeline` in order of their relative
+cost (see :func:`spam_filter`), so that expensive checks only run when the
+cheap ones passed.
 """
 
+import logging
+import threading
+
+from django.utils.module_loading import import_string
+
+from envelope.metrics import get_metrics, timer
+from envelope.settings import settings
+
+
+logger = logging.getLogger('envelope.spam_filters')
+
+DEFAULT_COST = 10
+
+
+def spam_filter(cost=DEFAULT_COST):
+    """
+    Decorator which sets the relative cost of a spam filter.
+
+    Filters with lower cost run first. Filters without a declared cost
+    are assumed to cost ``DEFAULT_COST``.
+    """
+    def decorator(func):
+        func.cost = cost
+        return func
+    return decorator
+
 
+@spam_filter(cost=1)
 def check_honeypot(request, form):
     """
     Make sure that the hidden form field is empty, using django-honeypot.
@@ -16,3 +49,85 @@ def check_honeypot(request, form):
         return verify_honeypot_value(request, '') is None
     except ImportError:  # pragma: no cover
         return True
+
+
+@spam_filter(cost=50)
+def check_content(request, form):
+    """
+    Reject messages which the content classifier considers spam.
+
+    Uses the model given by ``ENVELOPE_CLASSIFIER_MODEL`` (see the
+    ``envelope_train_classifier`` management command). Messages scoring
+    at least ``ENVELOPE_CLASSIFIER_THRESHOLD`` are rejected.
+    """
+    from envelope.classifier import get_classifier
+    classifier = get_classifier()
+    if classifier is None:
+        return True
+    text = '%s\n%s' % (form.cleaned_data.get('subject', ''),
+                       form.cleaned_data.get('message', ''))
+    return classifier.score(text) < settings.CLASSIFIER_THRESHOLD
+
+
+class SpamFilterPipeline(object):
+    """
+    Runs spam filters from the cheapest to the most expensive one.
+
+    The pipeline stops at the first filter which rejects the message.
+    Time spent in each filter is accumulated in ``timings``, a dictionary
+    mapping filter names to ``(calls, total seconds)`` pairs.
+    """
+
+    def __init__(self, filters):
+        # sorted() is stable, so filters of equal cost keep their order
+        self.filters = sorted(filters,
+                              key=lambda f: getattr(f, 'cost', DEFAULT_COST))
+        self.timings = {}
+        self.lock = threading.Lock()
+
+    def run(self, request, form):
+        """
+        Returns the filter which rejected the message, or ``None``.
+
+        Timings and rejections are also reported to the metrics backend,
+        if one is configured.
+        """
+        metrics = get_metrics()
+        for spam_filter in self.filters:
+            start = timer()
+            passed = spam_filter(request, form)
+            self.record(spam_filter, timer() - start, metrics)
+            if not passed:
+                name = get_filter_name(spam_filter)
+                logger.warning("Rejected by %s", name)
+                if metrics is not None:
+                    metrics.increment('spam', filter=name)
+                return spam_filter
+        return None
+
+    def record(self, spam_filter, elapsed, metrics=None):
+        name = get_filter_name(spam_filter)
+        with self.lock:
+            calls, total = self.timings.get(name, (0, 0.0))
+            self.timings[name] = (calls + 1, total + elapsed)
+        if metrics is not None:
+            metrics.timing('spam_filter', elapsed, filter=name)
+
+
+def get_filter_name(spam_filter):
+    return getattr(spam_filter, '__name__', spam_filter.__class__.__name__)
+
+
+_pipelines = {}
+
+
+def get_spam_filter_pipeline():
+    """
+    Returns the pipeline built from ``ENVELOPE_SPAM_FILTERS``.
+    """
+    paths = tuple(settings.SPAM_FILTERS)
+    try:
+        return _pipelines[paths]
+    except KeyError:
+        pipeline = SpamFilterPipeline([import_string(p) for p in paths])
+        return _pipelines.setdefault(paths, pipeline)
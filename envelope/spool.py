@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+On-disk outbox for messages which are waiting to be sent.
+"""
+
+import errno
+import logging
+import os
+import pickle
+import time
+import uuid
+
+
+logger = logging.getLogger('envelope.spool')
+
+_replace = getattr(os, 'replace', os.rename)
+
+
+class SpoolEntry(object):
+    """
+    A single spooled message along with its delivery bookkeeping.
+    """
+
+    def __init__(self, name, message, sender=None, attempts=0, not_before=0):
+        self.name = name
+        self.message = message
+        self.sender = sender
+        self.attempts = attempts
+        self.not_before = not_before
+
+    def dump(self):
+        return pickle.dumps({
+            'message': self.message,
+            'sender': self.sender,
+            'attempts': self.attempts,
+            'not_before': self.not_before,
+        }, protocol=2)
+
+    @classmethod
+    def load(cls, name, data):
+        return cls(name, **pickle.loads(data))
+
+
+class Spool(object):
+    """
+    A directory of serialized messages.
+
+    The layout resembles a maildir: entries are written to ``tmp``, synced
+    to disk and atomically renamed into ``queue``. Messages which could not
+    be sent after ``max_attempts`` tries are moved to ``failed``.
+
+    File names in ``queue`` start with the time (in microseconds) at which
+    the entry is due, so entries which have been deferred are skipped
+    without reading them.
+
+    Only one process should drain the spool at a time, although any number
+    of processes can add messages to it.
+    """
+
+    def __init__(self, directory, max_attempts=5, retry_delay=60):
+        self.directory = directory
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.tmp_dir = os.path.join(directory, 'tmp')
+        self.queue_dir = os.path.join(directory, 'queue')
+        self.failed_dir = os.path.join(directory, 'failed')
+        for path in (self.tmp_dir, self.queue_dir, self.failed_dir):
+            try:
+                os.makedirs(path)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def put(self, message, sender=None):
+        """
+        Adds a message to the spool and returns its entry.
+        """
+        name = self._name(time.time(), '%s.msg' % uuid.uuid4().hex)
+        entry = SpoolEntry(name, message, sender=sender)
+        self._write(entry, self.queue_dir)
+        return entry
+
+    def pending(self, limit=None, now=None):
+        """
+        Returns entries which are due for delivery, oldest first.
+        """
+        if now is None:
+            now = time.time()
+        entries = []
+        for name in sorted(os.listdir(self.queue_dir)):
+            if limit is not None and len(entries) >= limit:
+                break
+            if self._due(name) > now:
+                break  # the remaining entries are sorted by due time
+            try:
+                with open(os.path.join(self.queue_dir, name), 'rb') as f:
+                    entry = SpoolEntry.load(name, f.read())
+            except (IOError, OSError):
+                continue  # removed in the meantime
+            except Exception:
+                logger.exception("Unreadable spool entry %s", name)
+                _replace(os.path.join(self.queue_dir, name),
+                         os.path.join(self.failed_dir, name))
+                continue
+            if entry.not_before <= now:
+                entries.append(entry)
+        return entries
+
+    def remove(self, entry):
+        """
+        Removes a delivered message from the spool.
+        """
+        os.remove(os.path.join(self.queue_dir, entry.name))
+
+    def retry(self, entry, now=None):
+        """
+        Schedules another delivery attempt with exponential backoff.
+
+        Returns ``False`` if the entry ran out of attempts and was moved
+        to the ``failed`` directory instead.
+        """
+        if now is None:
+            now = time.time()
+        entry.attempts += 1
+        if entry.attempts >= self.max_attempts:
+            self._write(entry, self.failed_dir)
+            self.remove(entry)
+            logger.error("Giving up on spooled message %s after %d attempts",
+                         entry.name, entry.attempts)
+            return False
+        entry.not_before = now + self.retry_delay * 2 ** (entry.attempts - 1)
+        # update the entry in place before renaming, so that a crash in
+        # between leaves a single copy which still knows when it is due
+        self._write(entry, self.queue_dir)
+        name = self._name(entry.not_before, entry.name.split('-', 1)[-1])
+        _replace(os.path.join(self.queue_dir, entry.name),
+                 os.path.join(self.queue_dir, name))
+        self._sync_directory(self.queue_dir)
+        entry.name = name
+        return True
+
+    def failed(self):
+        """
+        Returns names of the entries which could not be delivered.
+        """
+        return sorted(os.listdir(self.failed_dir))
+
+    def _name(self, due, suffix):
+        return '%020d-%s' % (int(due * 1000000), suffix)
+
+    def _due(self, name):
+        try:
+            return int(name.split('-', 1)[0]) / 1000000.0
+        except ValueError:
+            return 0  # read it anyway
+
+    def _write(self, entry, directory):
+        tmp_path = os.path.join(self.tmp_dir, entry.name)
+        with open(tmp_path, 'wb') as f:
+            f.write(entry.dump())
+            f.flush()
+            os.fsync(f.fileno())
+        _replace(tmp_path, os.path.join(directory, entry.name))
+        self._sync_directory(directory)
+
+    def _sync_directory(self, directory):
+        try:
+            fd = os.open(directory, os.O_RDONLY)
+        except OSError:  # pragma: no cover
+            return  # not supported on this platform
+        try:
+            os.fsync(fd)
+        except OSError:  # pragma: no cover
+            pass
+        finally:
+            os.close(fd)
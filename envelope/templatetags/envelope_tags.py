@@ -6,22 +6,42 @@ Template tags related to the contact form.
 from __future__ import unicode_literals
 
 from django import template
+from django.utils.encoding import force_text
+from django.utils.safestring import mark_safe
+from django.utils.translation import get_language
+
+from envelope.cache import get_cache
+from envelope.settings import settings
 
 register = template.Library()
 
+# markers substituted in the cached contact form markup
+CSRF_PLACEHOLDER = 'envelopecsrftokenplaceholder'
+ANTISPAM_PLACEHOLDER = '<!-- envelope:antispam_fields -->'
+
 try:
     import honeypot
 
-    # Register antispam_fields as an inclusion tag
     t = template.Template('{% load honeypot %}{% render_honeypot_field %}')
-    register.inclusion_tag(t, name='antispam_fields')(lambda: {})
+
+    def render_antispam_fields():
+        return t.render(template.Context())
 
 except ImportError:  # pragma: no cover
-    # Register antispam_fields as an empty tag
-    register.simple_tag(name='antispam_fields')(lambda: '')
+    def render_antispam_fields():
+        return ''
+
+
+@register.simple_tag(takes_context=True, name='antispam_fields')
+def antispam_fields(context):
+    """
+    Renders the hidden antispam fields (if django-honeypot is installed).
+    """
+    if context.get('envelope_antispam_placeholder'):
+        return mark_safe(ANTISPAM_PLACEHOLDER)
+    return mark_safe(render_antispam_fields())
 
 
-@register.inclusion_tag('envelope/contact_form.html', takes_context=True)
 def render_contact_form(context):
     """
     Renders the contact form which must be in the template context.
@@ -29,9 +49,70 @@ def render_contact_form(context):
     The most common use case for this template tag is to call it in the
     template rendered by :class:`~envelope.views.ContactView`. The template
     tag will then render a sub-template ``envelope/contact_form.html``.
+
+    If ``ENVELOPE_FORM_CACHE_TIMEOUT`` is set, the markup of an empty form
+    displayed to an anonymous user is cached; only the CSRF token and the
+    antispam fields are rendered on each request.
     """
     if 'form' not in context:
         raise template.TemplateSyntaxError(
             "There is no 'form' variable in the template context."
         )
     return context
+
+
+class ContactFormNode(template.Node):
+    template_name = 'envelope/contact_form.html'
+
+    def render(self, context):
+        render_contact_form(context)
+        t = context.template.engine.get_template(self.template_name)
+        timeout = settings.FORM_CACHE_TIMEOUT
+        csrf_token = force_text(context.get('csrf_token', 'NOTPROVIDED'))
+        if (timeout is None or csrf_token == 'NOTPROVIDED' or
+                not self.is_cacheable(context)):
+            new_context = context.new(context)
+            if 'csrf_token' in context:
+                new_context['csrf_token'] = context['csrf_token']
+            return t.render(new_context)
+        cache = get_cache()
+        key = self.get_cache_key(context['form'])
+        markup = cache.get(key)
+        if markup is None:
+            new_context = context.new(context)
+            new_context.update({
+                'csrf_token': CSRF_PLACEHOLDER,
+                'envelope_antispam_placeholder': True,
+            })
+            markup = force_text(t.render(new_context))
+            cache.set(key, markup, timeout)
+        markup = markup.replace(CSRF_PLACEHOLDER, csrf_token)
+        markup = markup.replace(ANTISPAM_PLACEHOLDER, render_antispam_fields())
+        return mark_safe(markup)
+
+    def is_cacheable(self, context):
+        """
+        Only an empty, unbound form shown to an anonymous user is cached.
+        """
+        form = context['form']
+        if getattr(form, 'is_bound', True) or getattr(form, 'initial', True):
+            return False
+        user = getattr(context.get('request'), 'user', None)
+        return not (user is not None and user.is_authenticated)
+
+    def get_cache_key(self, form):
+        form_class = form.__class__
+        return 'envelope:contact_form:%s:%s.%s:%s' % (
+            get_language(), form_class.__module__, form_class.__name__,
+            form.prefix or '',
+        )
+
+
+@register.tag(name='render_contact_form')
+def do_render_contact_form(parser, token):
+    bits = token.split_contents()
+    if len(bits) != 1:
+        raise template.TemplateSyntaxError(
+            "'%s' takes no arguments" % bits[0]
+        )
+    return ContactFormNode()
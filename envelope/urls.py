@@ -2,9 +2,12 @@
 
 from django.conf.urls import url
 
-from envelope.views import ContactView
+from envelope.views import ContactView, JSONContactView, JSONValidateView
 
 
 urlpatterns = [
     url(r'^$', ContactView.as_view(), name='envelope-contact'),
+    url(r'^json/$', JSONContactView.as_view(), name='envelope-contact-json'),
+    url(r'^json/validate/$', JSONValidateView.as_view(),
+        name='envelope-contact-validate'),
 ]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Additional validators for contact form fields.
+"""
+
+import logging
+import time
+
+from django.core.exceptions import ValidationError
+from django.utils.translation import ugettext_lazy as _
+
+from envelope.cache import TTLCache
+from envelope.settings import settings
+
+try:
+    import dns.exception
+    import dns.resolver
+except ImportError:  # pragma: no cover
+    dns = None
+
+
+logger = logging.getLogger('envelope.validators')
+
+domain_cache = TTLCache(max_size=10000)
+
+
+def lookup_domain(domain, timeout):
+    """
+    Checks whether the domain can receive email.
+
+    Returns ``True`` if the domain has MX (or, failing that, address)
+    records, ``False`` if it doesn't, and ``None`` if the answer could not
+    be obtained within ``timeout`` seconds or the name servers failed.
+
+    Requires `dnspython`_. The servers listed in ``ENVELOPE_DNS_NAMESERVERS``
+    are queried (or the system ones, if the setting is empty). Without
+    dnspython, ``None`` is returned: the system resolver can't tell a domain
+    without address records from one with MX records only, so it can't be
+    used to reject addresses.
+
+    .. _`dnspython`: http://www.dnspython.org/
+    """
+    if dns is None:
+        logger.warning("dnspython is not installed, email domains can't "
+                       "be verified")
+        return None
+    resolver = dns.resolver.Resolver(configure=not settings.DNS_NAMESERVERS)
+    if settings.DNS_NAMESERVERS:
+        resolver.nameservers = list(settings.DNS_NAMESERVERS)
+        resolver.port = settings.DNS_PORT
+    resolve = getattr(resolver, 'resolve', None) or resolver.query
+    deadline = time.time() + timeout
+    for rdtype in ('MX', 'A', 'AAAA'):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return None
+        resolver.timeout = resolver.lifetime = remaining
+        try:
+            resolve(domain, rdtype)
+            return True
+        except dns.resolver.NXDOMAIN:
+            return False
+        except dns.resolver.NoAnswer:
+            continue
+        except (dns.exception.Timeout, dns.resolver.NoNameservers):
+            # SERVFAIL or unreachable servers say nothing about the domain
+            return None
+    return False
+
+
+def check_email_domain(domain):
+    """
+    Cached version of ``lookup_domain()``.
+
+    Positive answers are cached for ``ENVELOPE_DNS_CACHE_TTL`` seconds,
+    negative ones for ``ENVELOPE_DNS_NEGATIVE_TTL`` seconds. Lookups which
+    timed out are not cached.
+    """
+    result = domain_cache.get(domain)
+    if result is not None:
+        return result
+    result = lookup_domain(domain, settings.DNS_TIMEOUT)
+    if result is None:
+        logger.warning("Could not verify email domain %s in time", domain)
+    elif result:
+        domain_cache.set(domain, True, settings.DNS_CACHE_TTL)
+    else:
+        domain_cache.set(domain, False, settings.DNS_NEGATIVE_TTL)
+    return result
+
+
+def validate_email_domain(value):
+    """
+    Rejects email addresses whose domain does not accept mail.
+
+    Addresses are accepted if the domain could not be checked in time.
+    """
+    domain = value.rpartition('@')[2].strip().lower()
+    if check_email_domain(domain) is False:
+        raise ValidationError(
+            _("The domain %(domain)s does not accept email."),
+            code='invalid_domain',
+            params={'domain': domain},
+        )
@@ -6,14 +6,25 @@ from __future__ import unicode_literals
 Views used to process the contact form.
 """
 
+import json
 import logging
+import math
 
-from django.http import HttpResponseBadRequest
+from django.http import (HttpResponse, HttpResponseBadRequest, JsonResponse,
+                         QueryDict)
 from django.shortcuts import redirect
+from django.utils.decorators import method_decorator
+from django.utils.encoding import force_text
+from django.utils.translation import ugettext as _
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
 from django.views.generic import FormView
 
 from envelope import signals
-from envelope.forms import ContactForm
+from envelope.archive import archive_message
+from envelope.attachments import AttachmentUploadHandler
+from envelope.forms import AttachmentContactForm, ContactForm
+from envelope.metrics import get_metrics, timer
+from envelope.settings import settings
 
 
 logger = logging.getLogger('envelope.views')
@@ -90,19 +101,69 @@ class ContactView(FormView):
         kwargs.update(self.form_kwargs)
         return kwargs
 
+    def post(self, request, *args, **kwargs):
+        """
+        Throttles the request before the form is even validated.
+        """
+        responses = signals.throttle.send(sender=self.__class__,
+                                          request=request)
+        delays = [response for (receiver, response) in responses if response]
+        if delays:
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.increment('throttled')
+            return self.throttled(max(delays))
+        return super(ContactView, self).post(request, *args, **kwargs)
+
+    def throttled(self, retry_after):
+        """
+        Returns a 429 response telling the client when to try again.
+        """
+        response = HttpResponse(status=429)
+        response['Retry-After'] = '%d' % int(math.ceil(retry_after))
+        return response
+
     def form_valid(self, form):
         """
         Sends the message and redirects the user to ``success_url``.
         """
-        responses = signals.before_send.send(sender=self.__class__,
-                                             request=self.request,
-                                             form=form)
+        if not self.check_before_send(form):
+            return HttpResponseBadRequest()
+        form.save()
+        return redirect(self.get_success_url())
+
+    def check_before_send(self, form):
+        """
+        Sends the ``before_send`` signal and returns ``False`` if any of the
+        receivers rejected the message.
+
+        If ``ENVELOPE_PARALLEL_BEFORE_SEND`` is enabled, the ``before_send``
+        receivers are called concurrently.
+        """
+        metrics = get_metrics()
+        if metrics is not None:
+            start = timer()
+        if settings.PARALLEL_BEFORE_SEND:
+            responses = signals.send_concurrently(
+                signals.before_send, sender=self.__class__,
+                timeout=settings.BEFORE_SEND_TIMEOUT,
+                request=self.request, form=form,
+            )
+        else:
+            responses = signals.before_send.send(sender=self.__class__,
+                                                 request=self.request,
+                                                 form=form)
+        if metrics is not None:
+            metrics.timing('before_send', timer() - start)
         for (receiver, response) in responses:
             if not response:
                 logger.warning("Rejected by %s", receiver.__name__)
-                return HttpResponseBadRequest()
-        form.save()
-        return redirect(self.get_success_url())
+                if metrics is not None:
+                    metrics.increment('rejected', receiver=receiver.__name__)
+                from envelope.models import ContactMessage
+                archive_message(form, ContactMessage.REJECTED)
+                return False
+        return True
 
     def form_invalid(self, form):
         """
@@ -111,20 +172,186 @@ class ContactView(FormView):
         return self.render_to_response(self.get_context_data(form=form))
 
 
+class AttachmentContactView(ContactView):
+    """
+    Contact form view accepting file attachments.
+
+    Uploaded files are handled by
+    :class:`~envelope.attachments.AttachmentUploadHandler`, which writes
+    them to temporary files and stops storing data as soon as one of the
+    size limits is exceeded. The default form class is
+    :class:`~envelope.forms.AttachmentContactForm`.
+    """
+    form_class = AttachmentContactForm
+
+    @method_decorator(csrf_exempt)
+    def dispatch(self, request, *args, **kwargs):
+        # upload handlers can't be replaced once the CSRF middleware has
+        # read request.POST, so the CSRF check is done after this
+        request.upload_handlers = [AttachmentUploadHandler(request)]
+        return self._dispatch(request, *args, **kwargs)
+
+    @method_decorator(csrf_protect)
+    def _dispatch(self, request, *args, **kwargs):
+        return super(AttachmentContactView, self).dispatch(request, *args,
+                                                           **kwargs)
+
+
+class JSONContactView(ContactView):
+    """
+    Contact form view for JavaScript clients.
+
+    Accepts JSON objects (``Content-Type: application/json``) as well as
+    form-encoded POST requests, and responds with compact JSON documents
+    instead of rendering templates:
+
+    * ``{"success": true}`` after the message was sent,
+    * ``{"errors": {"field": ["message", ...], ...}}`` with status 400 if the
+      form is invalid or the message was rejected (errors not tied to a
+      field are listed under ``"__all__"``),
+    * ``{"retry_after": seconds}`` with status 429 if the client is
+      throttled.
+
+    As with any POST request, the CSRF token has to be sent, for example
+    in the ``X-CSRFToken`` header.
+    """
+    http_method_names = ['post', 'options']
+
+    def post(self, request, *args, **kwargs):
+        error = self.load_json(request)
+        if error is not None:
+            return error
+        return super(JSONContactView, self).post(request, *args, **kwargs)
+
+    def load_json(self, request):
+        """
+        Replaces ``request.POST`` with the decoded JSON object, if the request
+        has a JSON body. Returns an error response if it can't be decoded.
+        """
+        if request.content_type != 'application/json':
+            return None
+        try:
+            data = json.loads(request.body.decode(request.encoding or 'utf-8'))
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            return self.json_errors({'__all__': [_("Invalid JSON.")]})
+        # make the data available to everything reading request.POST,
+        # such as the honeypot spam filter; FILES is loaded first, because
+        # loading it later would reset POST
+        request.FILES
+        request.POST = to_query_dict(data)
+        return None
+
+    def throttled(self, retry_after):
+        response = JsonResponse({'retry_after': int(math.ceil(retry_after))},
+                                status=429)
+        response['Retry-After'] = '%d' % int(math.ceil(retry_after))
+        return response
+
+    def form_valid(self, form):
+        if not self.check_before_send(form):
+            return self.json_errors({
+                '__all__': [_("The message was rejected.")],
+            })
+        form.save()
+        return JsonResponse({'success': True})
+
+    def form_invalid(self, form):
+        return self.json_errors(get_errors(form))
+
+    def json_errors(self, errors, status=400):
+        return JsonResponse({'errors': errors}, status=status)
+
+
+class JSONValidateView(JSONContactView):
+    """
+    Validates the contact form without sending anything.
+
+    Responds with ``{"errors": {...}}`` (empty if there are no errors),
+    always with status 200. If the request has ``field`` query parameters
+    (e.g. ``?field=email``), only errors of these fields are returned, so
+    that fields can be checked one by one as the user fills in the form.
+
+    Requests are not throttled, so the email domain is not verified here
+    (``ENVELOPE_VERIFY_EMAIL_DOMAIN`` would let anyone trigger DNS lookups
+    without limit); it is still checked when the form is submitted.
+    """
+
+    def post(self, request, *args, **kwargs):
+        error = self.load_json(request)
+        if error is not None:
+            return error
+        # nothing gets sent, so there's no need for throttling
+        return FormView.post(self, request, *args, **kwargs)
+
+    def get_form_kwargs(self):
+        kwargs = super(JSONValidateView, self).get_form_kwargs()
+        kwargs['verify_email_domain'] = False
+        return kwargs
+
+    def form_valid(self, form):
+        return self.json_errors({}, status=200)
+
+    def form_invalid(self, form):
+        errors = get_errors(form)
+        fields = self.request.GET.getlist('field')
+        if fields:
+            errors = dict((k, v) for k, v in errors.items() if k in fields)
+        return self.json_errors(errors, status=200)
+
+
+def to_query_dict(data):
+    query_dict = QueryDict('', mutable=True)
+    for key, value in data.items():
+        values = value if isinstance(value, list) else [value]
+        query_dict.setlist(key, ['' if v is None else force_text(v)
+                                 for v in values])
+    return query_dict
+
+
+def get_errors(form):
+    return dict(
+        (field, [force_text(message) for message in messages])
+        for field, messages in form.errors.items()
+    )
+
+
 def filter_spam(sender, request, form, **kwargs):
     """
     Handle spam filtering.
 
     This function is called when the ``before_send`` signal fires,
     passing the current request and form object to the function.
-    With that information in hand, all available spam filters are called.
+    With that information in hand, the spam filters listed in
+    ``ENVELOPE_SPAM_FILTERS`` are called, cheapest first, until one
+    of them rejects the message.
+    """
+    if issubclass(sender, ContactView):
+        from envelope.spam_filters import get_spam_filter_pipeline
+        return get_spam_filter_pipeline().run(request, form) is None
+
+
+def check_rate_limit(sender, request, **kwargs):
+    """
+    Handle rate limiting.
 
-    TODO: more spam filters
+    This function is called when the ``throttle`` signal fires. If
+    ``ENVELOPE_RATELIMIT`` is set, it returns the number of seconds the
+    client has to wait before the next submission is accepted.
     """
     if issubclass(sender, ContactView):
-        from envelope.spam_filters import check_honeypot
-        return check_honeypot(request, form)
+        from envelope.ratelimit import get_rate_limit_key, get_rate_limiter
+        limiter = get_rate_limiter()
+        if limiter is not None:
+            key = get_rate_limit_key(request)
+            retry_after = limiter.hit(key)
+            if retry_after is not None:
+                logger.warning("Throttled %s", key)
+            return retry_after
 
 
+signals.throttle.connect(check_rate_limit,
+                         dispatch_uid='envelope.views.check_rate_limit')
 signals.before_send.connect(filter_spam,
                             dispatch_uid='envelope.views.filter_spam')
@@ -15,6 +15,7 @@ SECRET_KEY = 'thisisntactuallysecretatall'
 ALLOWED_HOSTS = ['*']
 
 INSTALLED_APPS = (
+    'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
     'django.contrib.sessions',
@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for the message archive admin.
+"""
+
+from django.contrib.auth.models import User
+
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+from django.contrib.admin.views.main import ALL_VAR
+from django.test import TestCase, override_settings
+
+from envelope.admin import KeysetPaginator
+from envelope.models import ContactMessage
+
+
+class ContactMessageAdminTestCase(TestCase):
+    """
+    Unit tests for ``ContactMessageAdmin``.
+    """
+
+    def setUp(self):
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        self.client.login(username='admin', password='admin')
+        self.url = reverse('admin:envelope_contactmessage_changelist')
+        ContactMessage.objects.bulk_create([
+            ContactMessage(sender='zbyszek', email='test@example.com',
+                           subject='Subject %d' % i, message='Hello')
+            for i in range(150)
+        ])
+
+    def test_paginator_count(self):
+        paginator = KeysetPaginator(ContactMessage.objects.all(), 100)
+        self.assertEqual(paginator.count, 101)
+        paginator = KeysetPaginator(ContactMessage.objects.all(), 200)
+        self.assertEqual(paginator.count, 150)
+
+    def test_older_messages(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        results = list(response.context['cl'].result_list)
+        self.assertEqual(len(results), 100)
+        url = response.context['older_messages_url']
+        self.assertEqual(url, '?id__lt=%d' % results[-1].pk)
+        self.assertContains(response, 'Older messages')
+
+        response = self.client.get(self.url + url)
+        self.assertEqual(len(response.context['cl'].result_list), 50)
+        self.assertNotIn('older_messages_url', response.context)
+
+    def test_no_show_all(self):
+        response = self.client.get(self.url, {ALL_VAR: ''})
+        self.assertEqual(len(response.context['cl'].result_list), 100)
+        self.assertFalse(response.context['cl'].can_show_all)
+
+    def test_index(self):
+        """
+        The archive is only listed on the admin index when it is in use.
+        """
+        index_url = reverse('admin:index')
+        response = self.client.get(index_url)
+        self.assertNotContains(response, self.url)
+        with override_settings(ENVELOPE_ARCHIVE=True):
+            response = self.client.get(index_url)
+        self.assertContains(response, self.url)
+        with override_settings(
+                ENVELOPE_DELIVERY_BACKEND='envelope.delivery.DigestBackend'):
+            response = self.client.get(index_url)
+        self.assertContains(response, self.url)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for the message archive.
+"""
+
+import os
+import subprocess
+import sys
+
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+from django.test import TestCase, override_settings
+
+from envelope import archive
+from envelope.archive import MessageArchive
+from envelope.models import ContactMessage
+
+
+class MessageArchiveTestCase(TestCase):
+    """
+    Unit tests for ``MessageArchive``.
+    """
+
+    def setUp(self):
+        self.archive = MessageArchive(batch_size=3, flush_interval=60)
+
+    def tearDown(self):
+        self.archive._take()
+
+    def make_message(self, i):
+        return ContactMessage(sender='zbyszek', email='test@example.com',
+                              subject='Subject %d' % i, message='Hello')
+
+    def test_buffered(self):
+        self.archive.add(self.make_message(1))
+        self.archive.add(self.make_message(2))
+        self.assertEqual(ContactMessage.objects.count(), 0)
+        self.assertIsNotNone(self.archive.timer)
+
+    def test_full_batch(self):
+        """
+        A full batch is written with a single query.
+        """
+        self.archive.add(self.make_message(1))
+        self.archive.add(self.make_message(2))
+        with self.assertNumQueries(1):
+            self.archive.add(self.make_message(3))
+        self.assertEqual(ContactMessage.objects.count(), 3)
+        self.assertEqual(self.archive.pending, [])
+        self.assertIsNone(self.archive.timer)
+
+    def test_flush(self):
+        self.archive.add(self.make_message(1))
+        self.archive.flush()
+        self.assertEqual(ContactMessage.objects.count(), 1)
+        self.assertIsNone(self.archive.timer)
+
+
+class ArchiveMessageTestCase(TestCase):
+    """
+    Submissions recorded by the contact form view.
+    """
+
+    def setUp(self):
+        archive._archive = None
+        self.url = reverse('envelope-contact')
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+            'email2': '',
+        }
+
+    def tearDown(self):
+        if archive._archive is not None:
+            archive._archive._take()
+        archive._archive = None
+
+    def test_disabled_by_default(self):
+        self.client.post(self.url, self.form_data)
+        self.assertIsNone(archive.get_archive())
+        self.assertEqual(ContactMessage.objects.count(), 0)
+
+    @override_settings(ENVELOPE_ARCHIVE=True, ENVELOPE_ARCHIVE_BATCH_SIZE=1)
+    def test_accepted(self):
+        self.client.post(self.url, self.form_data)
+        message = ContactMessage.objects.get()
+        self.assertEqual(message.status, ContactMessage.ACCEPTED)
+        self.assertEqual(message.email, 'test@example.com')
+        self.assertEqual(message.subject, 'A subject')
+
+    @override_settings(ENVELOPE_ARCHIVE=True, ENVELOPE_ARCHIVE_BATCH_SIZE=1)
+    def test_rejected(self):
+        self.form_data['email2'] = 'spam'
+        self.client.post(self.url, self.form_data)
+        message = ContactMessage.objects.get()
+        self.assertEqual(message.status, ContactMessage.REJECTED)
+
+    @override_settings(ENVELOPE_ARCHIVE=True, ENVELOPE_ARCHIVE_BATCH_SIZE=10)
+    def test_batched(self):
+        for i in range(3):
+            self.client.post(self.url, self.form_data)
+        self.assertEqual(ContactMessage.objects.count(), 0)
+        archive.get_archive().flush()
+        self.assertEqual(ContactMessage.objects.count(), 3)
+
+
+class ImportTestCase(TestCase):
+    """
+    The archive must not make importing envelope depend on settings.
+    """
+
+    def test_import_without_settings(self):
+        env = dict(os.environ)
+        env.pop('DJANGO_SETTINGS_MODULE', None)
+        code = 'import envelope.forms, envelope.views, envelope.delivery'
+        subprocess.check_call([sys.executable, '-c', code], env=env)
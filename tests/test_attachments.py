@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for contact message attachments.
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils.datastructures import MultiValueDict
+
+from envelope.attachments import AttachmentUploadHandler, sniff_content_type
+from envelope.forms import AttachmentContactForm
+from envelope.views import AttachmentContactView
+
+
+# a 1x1 transparent PNG
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhf'
+    'DwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+class SniffContentTypeTestCase(TestCase):
+    """
+    Unit tests for ``sniff_content_type()``.
+    """
+
+    def test_signatures(self):
+        self.assertEqual(sniff_content_type(PNG), 'image/png')
+        self.assertEqual(sniff_content_type(b'%PDF-1.4\n'), 'application/pdf')
+        self.assertEqual(sniff_content_type(b'GIF89a...'), 'image/gif')
+        self.assertEqual(sniff_content_type(b'\xff\xd8\xff\xe0'),
+                         'image/jpeg')
+        self.assertEqual(sniff_content_type(b'RIFF\0\0\0\0WEBPVP8 '),
+                         'image/webp')
+
+    def test_text(self):
+        self.assertEqual(sniff_content_type('zażółć'.encode('utf-8')),
+                         'text/plain')
+        # a multibyte character cut in half at the end of the sample
+        data = b'a' * 511 + 'ż'.encode('utf-8')
+        self.assertEqual(sniff_content_type(data), 'text/plain')
+
+    def test_binary(self):
+        self.assertEqual(sniff_content_type(b'MZ\x90\0\x03'),
+                         'application/octet-stream')
+        self.assertEqual(sniff_content_type(b''), 'application/octet-stream')
+
+
+class AttachmentUploadHandlerTestCase(TestCase):
+    """
+    Unit tests for ``AttachmentUploadHandler``.
+    """
+
+    def upload(self, handler, name, chunks):
+        handler.new_file('attachments', name, 'image/png', None)
+        for chunk in chunks:
+            handler.receive_data_chunk(chunk, 0)
+        f = handler.file_complete(sum(len(chunk) for chunk in chunks))
+        self.addCleanup(f.close)
+        return f
+
+    def test_sniffs_first_chunk(self):
+        handler = AttachmentUploadHandler(max_size=100, max_total_size=100)
+        f = self.upload(handler, 'a.txt', [b'hello ', b'world'])
+        self.assertEqual(f.content_type, 'text/plain')
+        self.assertIsNone(f.limit_exceeded)
+        self.assertEqual(f.size, 11)
+        self.assertEqual(f.read(), b'hello world')
+
+    def test_max_size(self):
+        handler = AttachmentUploadHandler(max_size=10, max_total_size=100)
+        f = self.upload(handler, 'a.txt', [b'a' * 8, b'a' * 8, b'a' * 8])
+        self.assertEqual(f.limit_exceeded, 'max_size')
+        self.assertEqual(f.size, 24)
+        # data beyond the limit is not stored
+        self.assertEqual(f.read(), b'')
+
+    def test_max_total_size(self):
+        handler = AttachmentUploadHandler(max_size=10, max_total_size=15)
+        first = self.upload(handler, 'a.txt', [b'a' * 10])
+        second = self.upload(handler, 'b.txt', [b'b' * 10])
+        self.assertIsNone(first.limit_exceeded)
+        self.assertEqual(second.limit_exceeded, 'max_total_size')
+        self.assertEqual(second.read(), b'')
+
+
+class AttachmentContactFormTestCase(TestCase):
+    """
+    Unit tests for ``AttachmentContactForm``.
+    """
+
+    def setUp(self):
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        }
+
+    def get_form(self, *files):
+        files = MultiValueDict({'attachments': list(files)})
+        return AttachmentContactForm(self.form_data, files)
+
+    def test_no_attachments(self):
+        form = AttachmentContactForm(self.form_data)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.cleaned_data['attachments'], [])
+        self.assertEqual(form.get_message().attachments, [])
+
+    def test_attachments(self):
+        form = self.get_form(
+            SimpleUploadedFile('robot.png', PNG, 'text/plain'),
+            SimpleUploadedFile('notes.txt', b'Some notes'),
+        )
+        self.assertTrue(form.is_valid(), form.errors)
+        attachments = form.get_message().attachments
+        self.assertEqual(attachments, [
+            ('robot.png', PNG, 'image/png'),
+            ('notes.txt', 'Some notes', 'text/plain'),
+        ])
+
+    def test_with_inline_images(self):
+        """
+        Attachments are not mixed with the inline images of the HTML part.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'robot.png')
+        with open(path, 'wb') as f:
+            f.write(PNG)
+        form = self.get_form(SimpleUploadedFile('doc.pdf', b'%PDF-1.4\n'))
+        self.assertTrue(form.is_valid(), form.errors)
+        with override_settings(ENVELOPE_INLINE_IMAGES={'robot': path}):
+            message = form.get_message().message()
+        self.assertEqual(message.get_content_type(), 'multipart/mixed')
+        related, attachment = message.get_payload()
+        self.assertEqual(related.get_content_type(), 'multipart/related')
+        self.assertEqual(
+            [part.get_content_type() for part in related.get_payload()],
+            ['multipart/alternative', 'image/png'],
+        )
+        self.assertEqual(attachment.get_content_type(), 'application/pdf')
+        self.assertEqual(attachment.get_filename(), 'doc.pdf')
+
+    def test_content_type_is_sniffed(self):
+        form = self.get_form(
+            SimpleUploadedFile('robot.png', b'MZ\x90\0\x03', 'image/png'),
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('application/octet-stream',
+                      form.errors['attachments'][0])
+
+    @override_settings(ENVELOPE_ATTACHMENT_MAX_FILES=1)
+    def test_max_files(self):
+        form = self.get_form(
+            SimpleUploadedFile('a.txt', b'a'),
+            SimpleUploadedFile('b.txt', b'b'),
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('at most 1 files', form.errors['attachments'][0])
+
+    @override_settings(ENVELOPE_ATTACHMENT_MAX_SIZE=10)
+    def test_max_size(self):
+        form = self.get_form(SimpleUploadedFile('a.txt', b'a' * 11))
+        self.assertFalse(form.is_valid())
+        self.assertIn('a.txt is larger than', form.errors['attachments'][0])
+
+    @override_settings(ENVELOPE_ATTACHMENT_MAX_TOTAL_SIZE=15)
+    def test_max_total_size(self):
+        form = self.get_form(
+            SimpleUploadedFile('a.txt', b'a' * 10),
+            SimpleUploadedFile('b.txt', b'b' * 10),
+        )
+        self.assertFalse(form.is_valid())
+        self.assertIn('The attachments are larger than',
+                      form.errors['attachments'][0])
+
+
+class AttachmentContactViewTestCase(TestCase):
+    """
+    Unit tests for ``AttachmentContactView``.
+    """
+
+    def setUp(self):
+        self.url = reverse('attachment_contact')
+        self.honeypot = getattr(settings, 'HONEYPOT_FIELD_NAME', 'email2')
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+            self.honeypot: '',
+        }
+
+    def test_multipart_form(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'enctype="multipart/form-data"')
+        self.assertContains(response, 'multiple')
+
+    def test_send_attachments(self):
+        self.form_data['attachments'] = [
+            SimpleUploadedFile('robot.png', PNG),
+            SimpleUploadedFile('notes.txt', b'Some notes'),
+        ]
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(mail.outbox), 1)
+        attachments = mail.outbox[0].attachments
+        self.assertEqual([a[0] for a in attachments],
+                         ['robot.png', 'notes.txt'])
+        self.assertEqual(attachments[0][1:], (PNG, 'image/png'))
+
+    @override_settings(ENVELOPE_ATTACHMENT_MAX_SIZE=10)
+    def test_too_large(self):
+        self.form_data['attachments'] = SimpleUploadedFile('a.txt', b'a' * 11)
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'a.txt is larger than')
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(ENVELOPE_ATTACHMENT_MAX_SIZE=10,
+                       ENVELOPE_ATTACHMENT_MAX_TOTAL_SIZE=15)
+    def test_total_too_large(self):
+        """
+        Files within the size limit, but over the total one, are reported
+        as such.
+        """
+        self.form_data['attachments'] = [
+            SimpleUploadedFile('a.txt', b'a' * 10),
+            SimpleUploadedFile('b.txt', b'b' * 10),
+        ]
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'The attachments are larger than')
+        self.assertNotContains(response, 'b.txt is larger than')
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_upload_handler(self):
+        request = RequestFactory().post(self.url, self.form_data)
+        view = AttachmentContactView()
+        view.dispatch(request)
+        self.assertIsInstance(request.upload_handlers[0],
+                              AttachmentUploadHandler)
+
+    def test_csrf(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 403)
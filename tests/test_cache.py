@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for envelope caches.
+"""
+
+import threading
+import time
+import unittest
+
+from envelope.cache import TTLCache
+
+
+class YieldingLock(object):
+    """
+    Lock which lets other threads run as soon as it is released.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        self.lock.acquire()
+
+    def __exit__(self, *exc_info):
+        self.lock.release()
+        time.sleep(0.01)
+
+
+class TTLCacheTestCase(unittest.TestCase):
+    """
+    Unit tests for ``TTLCache``.
+    """
+
+    def setUp(self):
+        self.cache = TTLCache(max_size=2)
+
+    def test_expiration(self):
+        self.cache.set('a', 1, 10, now=0)
+        self.assertEqual(self.cache.get('a', now=5), 1)
+        self.assertIsNone(self.cache.get('a', now=10))
+
+    def test_add(self):
+        self.assertTrue(self.cache.add('a', 1, 10, now=0))
+        self.assertFalse(self.cache.add('a', 2, 10, now=5))
+        self.assertEqual(self.cache.get('a', now=5), 1)
+        self.assertTrue(self.cache.add('a', 3, 10, now=10))
+
+    def test_concurrent_add(self):
+        """
+        Only one of concurrent ``add()`` calls for the same key succeeds.
+        """
+        self.cache.lock = YieldingLock()
+        results = []
+
+        def add():
+            results.append(self.cache.add('a', 1, 10))
+
+        threads = [threading.Thread(target=add) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(sorted(results), [False, False, False, True])
+
+    def test_delete(self):
+        self.cache.set('a', 1, 10, now=0)
+        self.cache.delete('a')
+        self.cache.delete('b')
+        self.assertIsNone(self.cache.get('a', now=0))
+
+    def test_lru_eviction(self):
+        """
+        The least recently used entry is evicted first.
+        """
+        self.cache.set('a', 1, 10, now=0)
+        self.cache.set('b', 2, 10, now=0)
+        self.cache.get('a', now=0)
+        self.cache.set('c', 3, 10, now=0)
+        self.assertEqual(self.cache.get('a', now=0), 1)
+        self.assertIsNone(self.cache.get('b', now=0))
+        self.assertEqual(self.cache.get('c', now=0), 3)
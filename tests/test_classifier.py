@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for the content spam classifier.
+"""
+
+import io
+import os
+import shutil
+import tempfile
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from envelope.classifier import Classifier, Trainer, tokenize
+from envelope.spam_filters import check_content
+
+
+SPAM = [
+    "Cheap pills online, buy now and save",
+    "Buy cheap watches now, best prices online",
+    "Make money fast with our online casino",
+]
+
+HAM = [
+    "Hello, I have a question about your article on Django forms",
+    "The contact page has a typo in the second paragraph",
+    "Could you send me the slides from your talk?",
+]
+
+
+class FakeForm(object):
+    def __init__(self, message):
+        self.cleaned_data = {'subject': '', 'message': message}
+
+
+class ClassifierTestCase(TestCase):
+    """
+    Unit tests for ``Trainer`` and ``Classifier``.
+    """
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.path = os.path.join(self.directory, 'model.bin')
+
+    def train(self):
+        trainer = Trainer(buckets=1024)
+        for text in SPAM:
+            trainer.add(text, True)
+        for text in HAM:
+            trainer.add(text, False)
+        trainer.save(self.path)
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize('Buy NOW'), set(['buy', 'now', 'buy now']))
+
+    def test_score(self):
+        self.train()
+        classifier = Classifier(self.path)
+        self.assertEqual(classifier.buckets, 1024)
+        self.assertGreater(classifier.score("buy cheap pills online"), 0.9)
+        self.assertLess(classifier.score("a question about your talk"), 0.1)
+
+    def test_invalid_model(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 64)
+        with self.assertRaises(ValueError):
+            Classifier(self.path)
+
+    def test_spam_filter(self):
+        """
+        ``check_content`` rejects messages that score above the threshold.
+        """
+        self.assertTrue(check_content(None, FakeForm("cheap pills")))
+        self.train()
+        with override_settings(ENVELOPE_CLASSIFIER_MODEL=self.path):
+            self.assertFalse(check_content(None, FakeForm("cheap pills")))
+            self.assertTrue(check_content(None, FakeForm("your talk")))
+
+    def test_train_command(self):
+        csv_path = os.path.join(self.directory, 'export.csv')
+        with io.open(csv_path, 'w', encoding='utf-8') as f:
+            f.write('label,subject,message\n')
+            for text in SPAM:
+                f.write('spam,,"%s"\n' % text)
+            for text in HAM:
+                f.write('ham,,"%s"\n' % text)
+            f.write('spam,Tanie leki,Zamów tanie leki już dziś\n')
+        out = StringIO()
+        call_command('envelope_train_classifier', csv_path,
+                     output=self.path, buckets=1024, stdout=out)
+        self.assertIn('4 spam and 3 legitimate', out.getvalue())
+        classifier = Classifier(self.path)
+        self.assertGreater(classifier.score("cheap pills"), 0.5)
+        self.assertGreater(classifier.score("tanie leki już dziś"), 0.5)
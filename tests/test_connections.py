@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for the connection pool.
+"""
+
+import threading
+import time
+import unittest
+from smtplib import SMTPServerDisconnected
+
+try:
+    from unittest.mock import Mock, patch
+except ImportError:
+    from mock import Mock, patch
+
+from django.core import mail
+from django.test import TestCase, override_settings
+
+from envelope import connections
+from envelope.connections import (ConnectionPool, PoolTimeout,
+                                  get_connection_pool)
+from envelope.delivery import ImmediateBackend, ThreadedBackend
+from envelope.forms import ContactForm
+
+
+class FakeSMTPBackend(object):
+    """
+    Mimics the SMTP email backend with a controllable connection.
+    """
+
+    def __init__(self):
+        self.connection = None
+        self.closed = False
+
+    def open(self):
+        self.connection = Mock()
+        self.connection.noop.return_value = (250, b'OK')
+
+    def close(self):
+        self.closed = True
+        self.connection = None
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    """
+    Unit tests for ``ConnectionPool``.
+    """
+
+    def setUp(self):
+        self.pool = ConnectionPool(size=2, max_idle=30)
+        patcher = patch('django.core.mail.get_connection',
+                        side_effect=FakeSMTPBackend)
+        self.get_connection = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuse(self):
+        """
+        A released connection is handed out again.
+        """
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(), connection)
+        self.assertEqual(self.get_connection.call_count, 1)
+
+    def test_broken(self):
+        """
+        A connection released as broken is closed.
+        """
+        connection = self.pool.acquire()
+        self.pool.release(connection, broken=True)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.pool.acquire(), connection)
+
+    def test_max_idle(self):
+        """
+        Connections idle for too long are not reused.
+        """
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        self.pool.idle[0] = (connection, time.time() - 60)
+        self.assertIsNot(self.pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+
+    def test_health_check(self):
+        """
+        A connection which doesn't respond to NOOP is replaced.
+        """
+        connection = self.pool.acquire()
+        self.pool.release(connection)
+        connection.connection.noop.side_effect = SMTPServerDisconnected
+        self.assertIsNot(self.pool.acquire(), connection)
+        self.assertTrue(connection.closed)
+
+    def test_size_limit(self):
+        """
+        No more than ``size`` connections are checked out at a time.
+        """
+        self.pool.acquire()
+        connection = self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire(timeout=0.05)
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(timeout=0.05), connection)
+
+    def test_wait(self):
+        """
+        A caller waiting for a connection gets the next one released.
+        """
+        first = self.pool.acquire()
+        self.pool.acquire()
+        timer = threading.Timer(0.05, self.pool.release, (first,))
+        timer.start()
+        self.addCleanup(timer.join)
+        self.assertIs(self.pool.acquire(timeout=5), first)
+
+    def test_non_smtp_backend(self):
+        """
+        Backends without a real connection are always considered alive.
+        """
+        self.assertTrue(self.pool.is_alive(object()))
+
+
+@override_settings(ENVELOPE_CONNECTION_POOL_SIZE=1)
+class PooledDeliveryTestCase(TestCase):
+    """
+    Sending messages over pooled connections.
+    """
+
+    def setUp(self):
+        self.addCleanup(setattr, connections, '_pool', None)
+        self.form = ContactForm({
+            'sender': 'me',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        })
+        self.assertTrue(self.form.is_valid())
+
+    def test_deliver(self):
+        """
+        Subsequent messages are sent over the same connection.
+        """
+        backend = ImmediateBackend()
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            self.assertTrue(backend.deliver(self.form.get_message(), self.form))
+            self.assertTrue(backend.deliver(self.form.get_message(), self.form))
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(get_connection_pool().idle), 1)
+
+    def test_threaded(self):
+        """
+        Background threads send messages over pooled connections too.
+        """
+        backend = ThreadedBackend(threads=1)
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            backend.deliver(self.form.get_message(), self.form)
+            backend.deliver(self.form.get_message(), self.form)
+            backend.join()
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(get_connection_pool().idle), 1)
+
+    @override_settings(ENVELOPE_CONNECTION_POOL_TIMEOUT=0.05)
+    def test_pool_timeout(self):
+        """
+        Delivery fails instead of waiting forever for a busy pool.
+        """
+        backend = ImmediateBackend()
+        connection = get_connection_pool().acquire()
+        self.addCleanup(get_connection_pool().release, connection)
+        self.assertFalse(backend.deliver(self.form.get_message(), self.form))
+        self.assertEqual(len(mail.outbox), 0)
@@ -0,0 +1,489 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for delivery backends.
+"""
+
+import shutil
+import tempfile
+from smtplib import SMTPException, SMTPServerDisconnected
+
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django import forms
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from envelope import signals
+from envelope.delivery import (BatchBackend, DigestBackend, ImmediateBackend,
+                               SpoolBackend, ThreadedBackend,
+                               get_delivery_backend)
+from envelope.forms import ContactForm
+from envelope.models import ContactMessage
+
+
+class DroppingSMTPBackend(object):
+    """
+    Mimics an SMTP email backend whose server drops the connection after
+    ``drop_after`` messages.
+    """
+
+    def __init__(self, drop_after):
+        self.drop_after = drop_after
+        self.connection = None
+        self.opened = 0
+
+    def open(self):
+        self.connection = self
+        self.opened += 1
+        self.count = 0
+
+    def close(self):
+        self.connection = None
+
+    def noop(self):
+        if self.count >= self.drop_after:
+            raise SMTPServerDisconnected()
+        return (250, b'OK')
+
+    def send_messages(self, messages):
+        if self.count >= self.drop_after:
+            raise SMTPServerDisconnected()
+        self.count += len(messages)
+        mail.outbox.extend(messages)
+        return len(messages)
+
+
+class DeliveryTestMixin(object):
+    def setUp(self):
+        self.form = ContactForm({
+            'sender': 'me',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        })
+        self.assertTrue(self.form.is_valid())
+        self.sent = []
+        signals.after_send.connect(self.handle_after_send)
+
+    def tearDown(self):
+        signals.after_send.disconnect(self.handle_after_send)
+
+    def handle_after_send(self, sender, message, form, **kwargs):
+        self.sent.append(message)
+
+
+class ImmediateBackendTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``ImmediateBackend``.
+    """
+
+    def test_deliver(self):
+        """
+        The message is sent right away and ``after_send`` fires.
+        """
+        backend = ImmediateBackend()
+        result = backend.deliver(self.form.get_message(), self.form)
+        self.assertTrue(result)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(len(self.sent), 1)
+
+    def test_send_many(self):
+        """
+        Several messages are sent over a single connection.
+        """
+        backend = ImmediateBackend()
+        messages = [
+            (self.form.get_message(), self.form, ContactForm)
+            for i in range(3)
+        ]
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            results = backend.send_many(messages)
+        self.assertEqual(results, [True, True, True])
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(len(self.sent), 3)
+
+    def test_deliver_smtp_error(self):
+        """
+        ``after_send`` does not fire if the message could not be sent.
+        """
+        backend = ImmediateBackend()
+        message = self.form.get_message()
+        with patch.object(message, 'send', side_effect=SMTPException):
+            result = backend.deliver(message, self.form)
+        self.assertFalse(result)
+        self.assertEqual(self.sent, [])
+
+
+class DeliverManyTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``deliver_many``.
+    """
+
+    def messages(self, count):
+        for i in range(count):
+            yield self.form.get_message(), self.form
+
+    @override_settings(ENVELOPE_BATCH_SIZE=2)
+    def test_single_connection(self):
+        """
+        ``ImmediateBackend`` keeps one connection for all chunks.
+        """
+        backend = ImmediateBackend()
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            results = list(backend.deliver_many(self.messages(5)))
+        self.assertEqual(results, [True] * 5)
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(get_connection.call_count, 1)
+
+    def test_reconnect_after_failure(self):
+        backend = ImmediateBackend()
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            with patch('django.core.mail.EmailMessage.send',
+                       side_effect=[True, SMTPException, True]):
+                results = list(backend.deliver_many(self.messages(3),
+                                                    chunk_size=1))
+        self.assertEqual(results, [True, False, True])
+        self.assertEqual(get_connection.call_count, 2)
+
+    def test_default(self):
+        """
+        Other backends deliver messages one by one.
+        """
+        backend = BatchBackend(batch_size=10, timeout=60)
+        results = list(backend.deliver_many(self.messages(3)))
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual(len(backend.pending), 3)
+        backend.flush()
+        self.assertEqual(len(mail.outbox), 3)
+
+
+class ThreadedBackendTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``ThreadedBackend``.
+    """
+
+    def test_deliver(self):
+        """
+        The message is sent in the background.
+        """
+        backend = ThreadedBackend(threads=1)
+        result = backend.deliver(self.form.get_message(), self.form)
+        self.assertTrue(result)
+        backend.join()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(len(self.sent), 1)
+        self.assertEqual(len(backend.workers), 1)
+
+    def test_queue_full(self):
+        """
+        When the queue is full, the message is sent synchronously.
+        """
+        backend = ThreadedBackend(threads=1, queue_size=1)
+        with patch.object(backend, 'start'):
+            backend.deliver(self.form.get_message(), self.form)
+            self.assertEqual(len(mail.outbox), 0)
+            backend.deliver(self.form.get_message(), self.form)
+            self.assertEqual(len(mail.outbox), 1)
+
+
+class BatchBackendTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``BatchBackend``.
+    """
+
+    def test_flush_on_timeout(self):
+        """
+        Messages are kept until the batch is flushed.
+        """
+        backend = BatchBackend(batch_size=10, timeout=60)
+        self.assertTrue(backend.deliver(self.form.get_message(), self.form))
+        self.assertTrue(backend.deliver(self.form.get_message(), self.form))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertIsNotNone(backend.timer)
+        backend.flush()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(self.sent), 2)
+        self.assertIsNone(backend.timer)
+
+    def test_flush_on_size(self):
+        """
+        A full batch is sent right away.
+        """
+        backend = BatchBackend(batch_size=2, timeout=60)
+        with patch.object(backend, '_send_batch') as send_batch:
+            backend.deliver(self.form.get_message(), self.form)
+            self.assertFalse(send_batch.called)
+            backend.deliver(self.form.get_message(), self.form)
+            self.assertTrue(send_batch.called)
+        self.assertEqual(len(send_batch.call_args[0][0]), 2)
+        self.assertEqual(backend.pending, [])
+
+    def test_reconnect_after_disconnect(self):
+        """
+        A connection dropped mid-batch is reopened for the rest of the batch.
+        """
+        backend = BatchBackend(batch_size=10, timeout=60)
+        for i in range(5):
+            backend.deliver(self.form.get_message(), self.form)
+        connection = DroppingSMTPBackend(drop_after=3)
+        with patch('django.core.mail.get_connection', return_value=connection):
+            backend.flush()
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(len(self.sent), 5)
+        self.assertEqual(connection.opened, 2)
+
+    def test_reconnect_once(self):
+        """
+        The connection is reopened only once per batch.
+        """
+        backend = BatchBackend(batch_size=10, timeout=60)
+        for i in range(5):
+            backend.deliver(self.form.get_message(), self.form)
+        connection = DroppingSMTPBackend(drop_after=1)
+        with patch('django.core.mail.get_connection', return_value=connection):
+            backend.flush()
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(connection.opened, 2)
+
+    def test_partial_failure(self):
+        """
+        ``after_send`` fires only for messages that were sent.
+        """
+        backend = BatchBackend(batch_size=10, timeout=60)
+        failing = self.form.get_message()
+        backend.deliver(self.form.get_message(), self.form)
+        backend.deliver(failing, self.form)
+        with patch.object(failing, 'send', side_effect=SMTPException):
+            backend.flush()
+        self.assertEqual(len(self.sent), 1)
+
+
+class SpoolBackendTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``SpoolBackend`` and the ``envelope_flush`` command.
+    """
+
+    def setUp(self):
+        super(SpoolBackendTestCase, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.backend = SpoolBackend(self.directory)
+
+    def tearDown(self):
+        super(SpoolBackendTestCase, self).tearDown()
+        shutil.rmtree(self.directory)
+
+    def test_deliver(self):
+        """
+        The message is written to the spool, but not sent yet.
+        """
+        result = self.backend.deliver(self.form.get_message(), self.form)
+        self.assertTrue(result)
+        self.assertEqual(len(self.backend.spool.pending()), 1)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(self.sent, [])
+
+    def test_flush(self):
+        """
+        Flushing the spool sends the messages and fires ``after_send``.
+        """
+        self.backend.deliver(self.form.get_message(), self.form)
+        self.backend.deliver(self.form.get_message(), self.form)
+        self.assertEqual(self.backend.flush(), (2, 0, 0))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(self.sent), 2)
+        self.assertEqual(mail.outbox[0].subject, self.form.get_subject())
+        self.assertEqual(self.backend.spool.pending(), [])
+
+    def test_flush_retry(self):
+        """
+        A message which could not be sent is retried later.
+        """
+        self.backend.deliver(self.form.get_message(), self.form)
+        with patch('django.core.mail.EmailMessage.send',
+                   side_effect=SMTPException):
+            self.assertEqual(self.backend.flush(), (0, 1, 0))
+        self.assertEqual(self.backend.spool.pending(), [])
+        entry = self.backend.spool.pending(now=float('inf'))[0]
+        self.assertEqual(entry.attempts, 1)
+
+    def test_flush_dead_letter(self):
+        """
+        After too many attempts the message is moved aside.
+        """
+        self.backend.spool.max_attempts = 2
+        self.backend.spool.retry_delay = 0
+        self.backend.deliver(self.form.get_message(), self.form)
+        with patch('django.core.mail.EmailMessage.send',
+                   side_effect=SMTPException):
+            self.assertEqual(self.backend.flush(), (0, 1, 1))
+        self.assertEqual(self.backend.spool.pending(now=float('inf')), [])
+        self.assertEqual(len(self.backend.spool.failed()), 1)
+
+    def test_flush_command(self):
+        """
+        The ``envelope_flush`` command drains the configured spool.
+        """
+        self.backend.deliver(self.form.get_message(), self.form)
+        out = StringIO()
+        with override_settings(ENVELOPE_SPOOL_DIR=self.directory):
+            call_command('envelope_flush', stdout=out)
+        self.assertIn('Sent: 1', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_deferred_not_read(self):
+        """
+        Deferred entries are skipped without unpickling them.
+        """
+        spool = self.backend.spool
+        spool.put(self.form.get_message())
+        spool.retry(spool.pending()[0], now=1000)
+        spool.put(self.form.get_message())
+        with patch('envelope.spool.SpoolEntry.load',
+                   side_effect=AssertionError):
+            self.assertEqual(spool.pending(now=1059), [])
+        entries = spool.pending(now=float('inf'))
+        self.assertEqual([e.attempts for e in entries], [1, 0])
+        self.assertEqual(entries[0].not_before, 1060)
+
+    def test_legacy_deferred(self):
+        """
+        Entries whose name doesn't say when they are due are still
+        checked after reading them.
+        """
+        spool = self.backend.spool
+        entry = spool.put(self.form.get_message())
+        entry.not_before = float('inf')
+        spool._write(entry, spool.queue_dir)
+        self.assertEqual(spool.pending(), [])
+
+
+class DigestBackendTestCase(DeliveryTestMixin, TestCase):
+    """
+    Unit tests for ``DigestBackend``.
+    """
+
+    def setUp(self):
+        super(DigestBackendTestCase, self).setUp()
+        self.backend = DigestBackend()
+
+    def deliver(self, recipients=None):
+        message = self.form.get_message()
+        if recipients is not None:
+            message.to = recipients
+        self.assertTrue(self.backend.deliver(message, self.form))
+
+    def test_deliver(self):
+        """
+        The message is stored instead of being sent.
+        """
+        self.deliver()
+        self.assertEqual(len(mail.outbox), 0)
+        entry = ContactMessage.objects.get()
+        self.assertEqual(entry.status, ContactMessage.PENDING)
+        self.assertEqual(entry.recipients, 'webmaster@localhost')
+
+    def test_flush(self):
+        """
+        One digest is sent per list of recipients.
+        """
+        for i in range(3):
+            self.deliver()
+        self.deliver(['a@example.com', 'b@example.com'])
+        self.assertEqual(self.backend.flush(), (2, 4))
+        self.assertEqual(len(mail.outbox), 2)
+        self.assertEqual(len(self.sent), 2)
+        digest = [m for m in mail.outbox if m.to == ['webmaster@localhost']][0]
+        self.assertIn('3 messages', digest.subject)
+        self.assertEqual(digest.body.count('Hello there!'), 3)
+        self.assertFalse(ContactMessage.objects.filter(
+            status=ContactMessage.PENDING).exists())
+        self.assertEqual(self.backend.flush(), (0, 0))
+
+    def test_rendered_message(self):
+        """
+        Digests contain the rendered messages, including extra fields.
+        """
+        class PhoneContactForm(ContactForm):
+            phone = forms.CharField()
+
+            def get_context(self):
+                context = super(PhoneContactForm, self).get_context()
+                context['message'] = 'Call me at %s' % context['phone']
+                return context
+
+        self.form = PhoneContactForm(dict(self.form.data, phone='555-1234'))
+        self.assertTrue(self.form.is_valid())
+        self.deliver()
+        entry = ContactMessage.objects.get()
+        self.assertIn('Call me at 555-1234', entry.body)
+        self.backend.flush()
+        self.assertIn('Call me at 555-1234', mail.outbox[0].body)
+        self.assertIn('Subject: Message from contact form: A subject',
+                      mail.outbox[0].body)
+
+    def test_max_messages(self):
+        for i in range(5):
+            self.deliver()
+        self.assertEqual(self.backend.flush(max_messages=2), (3, 5))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_failure(self):
+        """
+        Messages stay pending if their digest could not be sent.
+        """
+        self.deliver()
+        with patch('django.core.mail.EmailMessage.send',
+                   side_effect=SMTPException):
+            self.assertEqual(self.backend.flush(), (0, 0))
+        self.assertEqual(ContactMessage.objects.get().status,
+                         ContactMessage.PENDING)
+
+    @override_settings(
+        ENVELOPE_ARCHIVE=True,
+        ENVELOPE_DELIVERY_BACKEND='envelope.delivery.DigestBackend',
+    )
+    def test_not_archived_twice(self):
+        self.form.save()
+        self.assertEqual(ContactMessage.objects.count(), 1)
+
+    def test_digest_command(self):
+        self.deliver()
+        out = StringIO()
+        call_command('envelope_digest', stdout=out)
+        self.assertIn('Sent 1 messages in 1 digests', out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+
+
+class GetDeliveryBackendTestCase(TestCase):
+    """
+    Unit tests for ``get_delivery_backend``.
+    """
+
+    def test_default_backend(self):
+        """
+        Messages are sent immediately by default.
+        """
+        self.assertIsInstance(get_delivery_backend(), ImmediateBackend)
+
+    def test_shared_instance(self):
+        """
+        The backend instance is reused.
+        """
+        path = 'envelope.delivery.ThreadedBackend'
+        self.assertIs(get_delivery_backend(path), get_delivery_backend(path))
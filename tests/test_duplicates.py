@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for duplicate submission detection.
+"""
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from envelope import duplicates
+from envelope.duplicates import get_fingerprint, is_duplicate
+from envelope.forms import ContactForm
+
+
+class FingerprintTestCase(TestCase):
+    def test_normalization(self):
+        """
+        Case and whitespace differences don't change the fingerprint.
+        """
+        first = get_fingerprint({'email': 'Test@Example.com',
+                                 'message': 'Hello  there!\n'})
+        second = get_fingerprint({'email': 'test@example.com',
+                                  'message': 'hello there!'})
+        self.assertEqual(first, second)
+
+    def test_different_messages(self):
+        first = get_fingerprint({'email': 'a@example.com', 'message': 'ab'})
+        second = get_fingerprint({'email': 'a@example.comab', 'message': ''})
+        self.assertNotEqual(first, second)
+
+
+class IsDuplicateTestCase(TestCase):
+    def setUp(self):
+        self.addCleanup(duplicates.local_cache.clear)
+        self.addCleanup(cache.clear)
+
+    def test_disabled(self):
+        self.assertFalse(is_duplicate('abc'))
+        self.assertFalse(is_duplicate('abc'))
+
+    @override_settings(ENVELOPE_DUPLICATE_WINDOW=60)
+    def test_local(self):
+        self.assertFalse(is_duplicate('abc'))
+        self.assertTrue(is_duplicate('abc'))
+        self.assertFalse(is_duplicate('def'))
+
+    @override_settings(ENVELOPE_DUPLICATE_WINDOW=60,
+                       ENVELOPE_DUPLICATE_CACHE='cache')
+    def test_django_cache(self):
+        self.assertFalse(is_duplicate('abc'))
+        self.assertTrue(is_duplicate('abc'))
+        self.assertTrue(cache.get('envelope:fingerprint:abc'))
+
+    @override_settings(ENVELOPE_DUPLICATE_WINDOW=60)
+    def test_form_save(self):
+        """
+        A repeated submission is accepted, but not sent again.
+        """
+        data = {
+            'sender': 'me',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        }
+        for i in range(2):
+            form = ContactForm(data)
+            self.assertTrue(form.is_valid())
+            self.assertTrue(form.save())
+        self.assertEqual(len(mail.outbox), 1)
+
+    @override_settings(ENVELOPE_DUPLICATE_WINDOW=60)
+    def test_failed_delivery(self):
+        """
+        A message which could not be delivered can be submitted again.
+        """
+        data = {
+            'sender': 'me',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        }
+        form = ContactForm(data)
+        self.assertTrue(form.is_valid())
+        with mock.patch('envelope.delivery.ImmediateBackend.deliver',
+                        return_value=False):
+            self.assertFalse(form.save())
+        form = ContactForm(data)
+        self.assertTrue(form.is_valid())
+        self.assertTrue(form.save())
+        self.assertEqual(len(mail.outbox), 1)
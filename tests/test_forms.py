@@ -6,15 +6,31 @@ from __future__ import unicode_literals
 Unit tests for ``django-envelope`` forms.
 """
 
+import io
+import itertools
+import os
+import shutil
+import tempfile
 import unittest
 from smtplib import SMTPException
 
+try:
+    from StringIO import StringIO
+except ImportError:
+    from io import StringIO
+
 try:
     from unittest.mock import patch
 except ImportError:
     from mock import patch
 
+from django.core import mail
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from envelope import duplicates, signals
 from envelope.forms import ContactForm
+from envelope.rendering import render_email
 
 
 class ContactFormTestCase(unittest.TestCase):
@@ -80,7 +96,7 @@ class ContactFormTestCase(unittest.TestCase):
         """
         form = ContactForm(self.form_data)
         self.assertTrue(form.is_valid())
-        with patch('django.core.mail.EmailMultiAlternatives') as mock_message:
+        with patch('envelope.forms.RelatedEmailMessage') as mock_message:
             mock_message.return_value.send.return_value = True
             result = form.save()
             self.assertTrue(result)
@@ -93,10 +109,30 @@ class ContactFormTestCase(unittest.TestCase):
         """
         form = ContactForm(self.form_data)
         self.assertTrue(form.is_valid())
-        with patch('django.core.mail.EmailMultiAlternatives') as mock_message:
+        with patch('envelope.forms.RelatedEmailMessage') as mock_message:
             form.save()
             self.assertTrue(mock_message.return_value.attach_alternative.called)
 
+    def test_html_from_text(self):
+        """
+        The HTML part can be derived from the plaintext body.
+        """
+        self.form_data['message'] = 'Hello <there>!'
+        form = ContactForm(self.form_data)
+        self.assertTrue(form.is_valid())
+        with override_settings(ENVELOPE_HTML_FROM_TEXT=True):
+            with patch('envelope.forms.render_email',
+                       wraps=render_email) as mock_render:
+                message = form.get_message()
+        self.assertEqual(mock_render.call_count, 1)
+        html_body, mimetype = message.alternatives[0]
+        self.assertEqual(mimetype, 'text/html')
+        self.assertIn('Hello &lt;there&gt;!', html_body)
+        self.assertIn('<p>', html_body)
+        # the plaintext template doesn't autoescape, the HTML part does
+        self.assertIn('Hello <there>!', message.body)
+        self.assertNotIn('&amp;', html_body)
+
     def test_init_attr_override(self):
         """
         Attributes can be overridden on __init__()
@@ -108,7 +144,7 @@ class ContactFormTestCase(unittest.TestCase):
         }
         form = ContactForm(self.form_data, **overrides)
         form.is_valid()
-        with patch('django.core.mail.EmailMultiAlternatives') as mock_message:
+        with patch('envelope.forms.RelatedEmailMessage') as mock_message:
             mock_message.return_value.send.return_value = True
             form.save()
             args, kwargs = mock_message.call_args
@@ -122,11 +158,23 @@ class ContactFormTestCase(unittest.TestCase):
         """
         form = ContactForm(self.form_data)
         self.assertTrue(form.is_valid())
-        with patch('django.core.mail.EmailMultiAlternatives') as mock_message:
+        with patch('envelope.forms.RelatedEmailMessage') as mock_message:
             mock_message.return_value.send.side_effect = SMTPException
             result = form.save()
             self.assertFalse(result)
 
+    def test_settings_override(self):
+        """
+        Form attributes follow the current settings.
+        """
+        with override_settings(ENVELOPE_SUBJECT_INTRO='Hi: ',
+                               ENVELOPE_EMAIL_RECIPIENTS=['to@example.com']):
+            form = ContactForm(self.form_data)
+            self.assertTrue(form.is_valid())
+            self.assertEqual(form.get_subject(), 'Hi: A subject')
+            self.assertEqual(form.get_email_recipients(), ['to@example.com'])
+        self.assertNotEqual(form.get_subject(), 'Hi: A subject')
+
     def _test_required_field(self, field_name):
         """
         Check that the form does not validate without a given field.
@@ -135,3 +183,87 @@ class ContactFormTestCase(unittest.TestCase):
         form = ContactForm(self.form_data)
         self.assertFalse(form.is_valid())
         self.assertIn(field_name, form.errors)
+
+
+class SaveManyTestCase(TestCase):
+    """
+    Unit tests for ``ContactForm.save_many``.
+    """
+
+    def make_forms(self, count, invalid=0):
+        for i in range(count):
+            yield ContactForm({
+                'sender': 'me',
+                'email': 'test%d@example.com' % i,
+                'subject': 'Subject %d' % i,
+                'message': 'Hello there!',
+            })
+        for i in range(invalid):
+            yield ContactForm({'sender': 'me', 'email': 'nope'})
+
+    def test_save_many(self):
+        """
+        Valid forms are sent over a single connection.
+        """
+        with patch('django.core.mail.get_connection',
+                   wraps=mail.get_connection) as get_connection:
+            result = ContactForm.save_many(self.make_forms(5, invalid=2))
+        self.assertEqual(result, (5, 0, 2, 0))
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(get_connection.call_count, 1)
+
+    @override_settings(ENVELOPE_BATCH_SIZE=2)
+    def test_chunks(self):
+        """
+        Forms are consumed lazily, one chunk at a time.
+        """
+        consumed = []
+        seen_at_send = []
+
+        def forms():
+            for form in self.make_forms(5):
+                consumed.append(form)
+                yield form
+
+        def handle_after_send(sender, **kwargs):
+            seen_at_send.append(len(consumed))
+
+        signals.after_send.connect(handle_after_send)
+        try:
+            results = ContactForm.save_many(forms())
+        finally:
+            signals.after_send.disconnect(handle_after_send)
+        self.assertEqual(results, (5, 0, 0, 0))
+        self.assertEqual(seen_at_send, [2, 2, 4, 4, 5])
+
+    def test_failures(self):
+        with patch('django.core.mail.EmailMessage.send',
+                   side_effect=SMTPException):
+            result = ContactForm.save_many(self.make_forms(3))
+        self.assertEqual(result, (0, 3, 0, 0))
+
+    @override_settings(ENVELOPE_DUPLICATE_WINDOW=60)
+    def test_duplicates(self):
+        """
+        Duplicates are counted separately, not as sent.
+        """
+        self.addCleanup(duplicates.local_cache.clear)
+        forms = itertools.chain(self.make_forms(2), self.make_forms(3))
+        result = ContactForm.save_many(forms)
+        self.assertEqual(result, (3, 0, 0, 2))
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_import_command(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'messages.csv')
+        with io.open(path, 'w', encoding='utf-8') as f:
+            f.write('sender,email,subject,message\n'
+                    'me,test@example.com,Zażółć,Hello there!\n'
+                    'me,not an email,Hi,Hello there!\n')
+        out = StringIO()
+        call_command('envelope_import', path, stdout=out)
+        self.assertIn('Sent: 1, failed: 0, invalid: 1, duplicates: 0',
+                      out.getvalue())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('Zażółć', mail.outbox[0].subject)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for inline images in HTML messages.
+"""
+
+import base64
+import os
+import shutil
+import tempfile
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from envelope.forms import ContactForm
+from envelope.images import get_inline_images
+
+
+# a 1x1 transparent PNG
+PNG = base64.b64decode(
+    'iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhf'
+    'DwAChwGA60e6kgAAAABJRU5ErkJggg=='
+)
+
+
+class InlineImagesTestCase(TestCase):
+    """
+    Unit tests for ``ENVELOPE_INLINE_IMAGES``.
+    """
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = os.path.join(directory, 'robot.png')
+        with open(self.path, 'wb') as f:
+            f.write(PNG)
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+        }
+
+    def get_message(self):
+        form = ContactForm(self.form_data)
+        self.assertTrue(form.is_valid())
+        return form.get_message()
+
+    def test_remote_image_by_default(self):
+        message = self.get_message()
+        self.assertIn('https://www.filepicker.io/', message.alternatives[0][0])
+        self.assertEqual(message.related_parts, [])
+        self.assertEqual(message.message().get_content_type(),
+                         'multipart/alternative')
+
+    def test_inline_image(self):
+        with override_settings(ENVELOPE_INLINE_IMAGES={'robot': self.path}):
+            message = self.get_message()
+        html = message.alternatives[0][0]
+        self.assertIn('src="cid:robot@envelope"', html)
+        self.assertNotIn('https://www.filepicker.io/', html)
+        raw = message.message()
+        self.assertEqual(raw.get_content_type(), 'multipart/related')
+        self.assertEqual(
+            [part.get_content_type() for part in raw.get_payload()],
+            ['multipart/alternative', 'image/png'],
+        )
+        image = raw.get_payload()[1]
+        self.assertEqual(image['Content-ID'], '<robot@envelope>')
+        self.assertEqual(image.get_payload(decode=True), PNG)
+
+    def test_encoded_once(self):
+        """
+        The same pre-encoded MIME part is attached to every message.
+        """
+        with override_settings(ENVELOPE_INLINE_IMAGES={'robot': self.path}):
+            first = self.get_message()
+            second = self.get_message()
+            part = get_inline_images()['robot'].part
+        self.assertIs(first.related_parts[0], second.related_parts[0])
+        self.assertIs(first.related_parts[0], part)
+
+    def test_unused_image(self):
+        """
+        Images not referenced by the template are not attached.
+        """
+        with override_settings(ENVELOPE_INLINE_IMAGES={'logo': self.path}):
+            message = self.get_message()
+        self.assertEqual(message.related_parts, [])
+
+    def test_not_found(self):
+        with override_settings(ENVELOPE_INLINE_IMAGES={'robot': 'robot.png'}):
+            with self.assertRaises(ImproperlyConfigured):
+                get_inline_images()
@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for metrics backends.
+"""
+
+import socket
+import unittest
+
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+from django.core import mail
+from django.test import RequestFactory, TestCase, override_settings
+
+from envelope import metrics
+from envelope.metrics import (PrometheusMetrics, StatsdMetrics, get_metrics,
+                              metrics_view)
+
+
+class PrometheusMetricsTestCase(unittest.TestCase):
+    """
+    Unit tests for ``PrometheusMetrics``.
+    """
+
+    def test_render(self):
+        backend = PrometheusMetrics()
+        backend.timing('send', 0.5)
+        backend.timing('send', 0.25)
+        backend.increment('spam', filter='check_honeypot')
+        backend.increment('spam', filter='check_honeypot')
+        lines = backend.render().splitlines()
+        self.assertIn('envelope_send_seconds_count 2', lines)
+        self.assertIn('envelope_send_seconds_sum 0.75', lines)
+        self.assertIn('envelope_spam_total{filter="check_honeypot"} 2', lines)
+
+    def test_escape_labels(self):
+        backend = PrometheusMetrics()
+        backend.increment('rejected', receiver='a"b')
+        self.assertIn('{receiver="a\\"b"}', backend.render())
+
+
+class StatsdMetricsTestCase(unittest.TestCase):
+    """
+    Unit tests for ``StatsdMetrics``.
+    """
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.settimeout(2)
+        self.backend = StatsdMetrics(port=self.server.getsockname()[1])
+
+    def tearDown(self):
+        self.server.close()
+        self.backend.socket.close()
+
+    def test_timing(self):
+        self.backend.timing('send', 0.25)
+        self.assertEqual(self.server.recv(1024), b'envelope.send:250.000|ms')
+
+    def test_timing_below_millisecond(self):
+        self.backend.timing('spam_filter', 0.0004, filter='check_links')
+        self.assertEqual(self.server.recv(1024),
+                         b'envelope.spam_filter.check_links:0.400|ms')
+
+    def test_increment_with_labels(self):
+        self.backend.increment('spam', filter='check_honeypot')
+        self.assertEqual(self.server.recv(1024),
+                         b'envelope.spam.check_honeypot:1|c')
+
+
+class InstrumentationTestCase(TestCase):
+    """
+    Metrics reported while processing the contact form.
+    """
+
+    def setUp(self):
+        metrics._backends.clear()
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+            'email2': '',
+        }
+
+    def tearDown(self):
+        metrics._backends.clear()
+
+    def test_disabled_by_default(self):
+        self.assertIsNone(get_metrics())
+
+    @override_settings(
+        ENVELOPE_METRICS_BACKEND='envelope.metrics.PrometheusMetrics')
+    def test_stages(self):
+        self.client.post(reverse('envelope-contact'), self.form_data)
+        self.assertEqual(len(mail.outbox), 1)
+        backend = get_metrics()
+        timings = dict((name, count) for (name, labels), (count, total)
+                       in backend.timings.items())
+        for stage in ('before_send', 'spam_filter', 'render', 'send'):
+            self.assertEqual(timings[stage], 1)
+        self.assertEqual(backend.counters[('sent', ())], 1)
+
+    @override_settings(
+        ENVELOPE_METRICS_BACKEND='envelope.metrics.PrometheusMetrics')
+    def test_spam_rejection(self):
+        self.form_data['email2'] = 'spam'
+        self.client.post(reverse('envelope-contact'), self.form_data)
+        backend = get_metrics()
+        self.assertEqual(
+            backend.counters[('spam', (('filter', 'check_honeypot'),))], 1)
+        self.assertEqual(
+            backend.counters[('rejected', (('receiver', 'filter_spam'),))], 1)
+
+    @override_settings(
+        ENVELOPE_METRICS_BACKEND='envelope.metrics.PrometheusMetrics')
+    def test_metrics_view(self):
+        get_metrics().increment('throttled')
+        response = metrics_view(RequestFactory().get('/metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'envelope_throttled_total 1', response.content)
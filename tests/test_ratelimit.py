@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for rate limiting.
+"""
+
+import re
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.test import RequestFactory, TestCase, override_settings
+
+from envelope.ratelimit import (CacheRateLimiter, LocalRateLimiter,
+                                get_rate_limit_key, parse_rate)
+
+
+class ParseRateTestCase(unittest.TestCase):
+    def test_parse_rate(self):
+        self.assertEqual(parse_rate('5/m'), (5, 60))
+        self.assertEqual(parse_rate('100/hour'), (100, 3600))
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ImproperlyConfigured):
+            parse_rate('lots')
+
+
+class LocalRateLimiterTestCase(unittest.TestCase):
+    """
+    Unit tests for ``LocalRateLimiter``.
+    """
+
+    def test_limit(self):
+        """
+        Requests over the limit are throttled until tokens refill.
+        """
+        limiter = LocalRateLimiter(2, 60)
+        self.assertIsNone(limiter.hit('a', now=0))
+        self.assertIsNone(limiter.hit('a', now=0))
+        self.assertAlmostEqual(limiter.hit('a', now=0), 30)
+        self.assertIsNone(limiter.hit('b', now=0))
+        self.assertIsNone(limiter.hit('a', now=30))
+
+    @patch.object(LocalRateLimiter, 'max_keys', 2)
+    def test_max_keys(self):
+        """
+        The least recently used bucket is dropped when there are too many.
+        """
+        limiter = LocalRateLimiter(1, 60)
+        limiter.hit('a', now=0)
+        limiter.hit('b', now=0)
+        self.assertIsNotNone(limiter.hit('a', now=1))
+        limiter.hit('c', now=2)
+        self.assertEqual(len(limiter.buckets.entries), 2)
+        self.assertIsNone(limiter.hit('b', now=3))
+        self.assertIsNotNone(limiter.hit('c', now=3))
+
+    def test_expiry(self):
+        """
+        Buckets which have been refilled completely are dropped.
+        """
+        limiter = LocalRateLimiter(2, 60)
+        limiter.hit('a', now=0)
+        self.assertIsNone(limiter.buckets.get('a', now=60))
+        self.assertNotIn('a', limiter.buckets.entries)
+
+
+class CacheRateLimiterTestCase(TestCase):
+    """
+    Unit tests for ``CacheRateLimiter``.
+    """
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_limit(self):
+        limiter = CacheRateLimiter(2, 60)
+        self.assertIsNone(limiter.hit('a', now=60))
+        self.assertIsNone(limiter.hit('a', now=70))
+        self.assertEqual(limiter.hit('a', now=80), 40)
+        self.assertIsNone(limiter.hit('b', now=80))
+
+    def test_sliding_window(self):
+        """
+        Requests from the previous window count proportionally.
+        """
+        limiter = CacheRateLimiter(2, 60)
+        limiter.hit('a', now=110)
+        limiter.hit('a', now=115)
+        self.assertIsNotNone(limiter.hit('a', now=125))
+        self.assertIsNone(limiter.hit('a', now=170))
+
+
+class RateLimitKeyTestCase(TestCase):
+    """
+    Unit tests for ``get_rate_limit_key``.
+    """
+
+    def get_key(self, data):
+        return get_rate_limit_key(RequestFactory().post('/', data))
+
+    def test_ip(self):
+        self.assertEqual(self.get_key({}), 'ip:127.0.0.1')
+
+    @override_settings(ENVELOPE_RATELIMIT_KEY='email')
+    def test_email(self):
+        """
+        Email addresses are normalized and hashed into safe cache keys.
+        """
+        key = self.get_key({'email': ' Test@Example.com\n'})
+        self.assertEqual(key, self.get_key({'email': 'test@example.com'}))
+        key = self.get_key({'email': 'a b\x01' + 'x' * 300})
+        self.assertTrue(re.match(r'^email:[0-9a-f]{40}$', key))
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for email template rendering.
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from django.test import TestCase, override_settings
+
+from envelope.rendering import TemplateCache, minify_html
+
+
+class TemplateCacheTestCase(TestCase):
+    """
+    Unit tests for ``TemplateCache``.
+    """
+
+    def setUp(self):
+        self.cache = TemplateCache()
+        self.context = {
+            'sender': 'me',
+            'email': 'test@example.com',
+            'message': 'Hello there!',
+        }
+
+    def test_hit(self):
+        """
+        The template is compiled only once.
+        """
+        first = self.cache.render('envelope/email_body.txt', self.context)
+        second = self.cache.render('envelope/email_body.txt', self.context)
+        self.assertEqual(first, second)
+        self.assertIn('Hello there!', first)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertEqual(self.cache.hit_rate, 0.5)
+
+    def test_template_list(self):
+        """
+        The first existing template from the list is used.
+        """
+        names = ['envelope/missing.txt', 'envelope/email_body.txt']
+        self.cache.render(names, self.context)
+        self.cache.render(names, self.context)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertIn(tuple(names), self.cache.templates)
+
+    @override_settings(DEBUG=True)
+    def test_debug(self):
+        """
+        Templates are not cached in DEBUG mode.
+        """
+        self.cache.render('envelope/email_body.txt', self.context)
+        self.cache.render('envelope/email_body.txt', self.context)
+        self.assertEqual(self.cache.hits, 0)
+        self.assertEqual(self.cache.templates, {})
+
+    def test_modified_template(self):
+        """
+        The template is compiled again after its file has changed.
+        """
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'body.txt')
+        with open(path, 'w') as f:
+            f.write('old {{ message }}')
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [directory],
+        }]
+        with override_settings(TEMPLATES=templates):
+            self.assertEqual(self.cache.render('body.txt', self.context),
+                             'old Hello there!')
+            with open(path, 'w') as f:
+                f.write('new {{ message }}')
+            mtime = time.time() + 10
+            os.utime(path, (mtime, mtime))
+            self.assertEqual(self.cache.render('body.txt', self.context),
+                             'new Hello there!')
+        self.assertEqual(self.cache.misses, 2)
+
+
+class MinifyHtmlTestCase(TestCase):
+    """
+    Unit tests for HTML email minification.
+    """
+
+    def setUp(self):
+        self.context = {
+            'sender': 'me',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello   there!',
+        }
+
+    def test_minify_html(self):
+        html = (
+            '<!-- comment -->\n<!--[if mso]><p>Outlook</p><![endif]-->\n'
+            '<style>\n  /* mobile */\n  td  { width: 100% ;  }\n</style>\n'
+            '    <td   style="color: red ; font-family: Helvetica,  Arial;'
+            ' color:blue;">\n\n   text  </td>'
+        )
+        self.assertEqual(minify_html(html), (
+            '\n<!--[if mso]><p>Outlook</p><![endif]-->\n'
+            '<style>td{width:100%;}</style>\n'
+            '<td style="color:red;font-family:Helvetica, Arial;color:blue">\n'
+            'text </td>'
+        ))
+
+    def test_repeated_properties(self):
+        """
+        Repeated properties are kept as fallbacks for older clients.
+        """
+        html = '<td style="background: #fff; background: rgba(0, 0, 0, .5)">'
+        self.assertEqual(
+            minify_html(html),
+            '<td style="background:#fff;background:rgba(0, 0, 0, .5)">',
+        )
+
+    def test_semicolon_in_value(self):
+        """
+        Semicolons inside ``url()`` or quotes don't split declarations.
+        """
+        html = (
+            '<td style="background: url(data:image/png;base64,AAAA) ;'
+            " font-family: 'a;b', serif\">"
+        )
+        self.assertEqual(minify_html(html), (
+            '<td style="background:url(data:image/png;base64,AAAA);'
+            "font-family:'a;b', serif\">"
+        ))
+
+    def test_idempotent(self):
+        html = '<p  style="margin: 0;">\n  a  b\n</p>'
+        self.assertEqual(minify_html(minify_html(html)), minify_html(html))
+
+    @override_settings(ENVELOPE_MINIFY_HTML=True)
+    def test_minified_template(self):
+        """
+        Static markup is minified, rendered variables are not.
+        """
+        cache = TemplateCache()
+        html = cache.render('envelope/email_body.html', self.context)
+        self.assertIn('Hello   there!', html)
+        self.assertNotIn('<!--', html)
+        self.assertNotIn('\n  ', html)
+        with override_settings(ENVELOPE_MINIFY_HTML=False):
+            original = TemplateCache().render('envelope/email_body.html',
+                                              self.context)
+        self.assertLess(len(html), len(original) * 0.75)
+
+    @override_settings(ENVELOPE_MINIFY_HTML=True)
+    def test_plaintext_untouched(self):
+        cache = TemplateCache()
+        with override_settings(ENVELOPE_MINIFY_HTML=False):
+            original = TemplateCache().render('envelope/email_body.txt',
+                                              self.context)
+        self.assertEqual(cache.render('envelope/email_body.txt', self.context),
+                         original)
+
+    @override_settings(ENVELOPE_MINIFY_HTML=True)
+    def test_preformatted(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        with open(os.path.join(directory, 'pre.html'), 'w') as f:
+            f.write('<pre>\n  {{ message }}\n</pre>')
+        templates = [{
+            'BACKEND': 'django.template.backends.django.DjangoTemplates',
+            'DIRS': [directory],
+        }]
+        with override_settings(TEMPLATES=templates):
+            html = TemplateCache().render('pre.html', self.context)
+        self.assertEqual(html, '<pre>\n  Hello   there!\n</pre>')
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for recipient routing.
+"""
+
+import unittest
+
+from django.core.exceptions import ImproperlyConfigured
+from django.test import TestCase, override_settings
+
+from envelope.forms import ContactForm
+from envelope.routing import MAX_GROUPS, Router, get_router
+
+
+ROUTES = [
+    {'category': 'billing', 'recipients': ['billing@example.com']},
+    {'subject': r'^\[bug\]', 'recipients': ['dev@example.com']},
+    {'keywords': ['refund', 'invoice'], 'recipients': ['billing@example.com']},
+    {'keywords': ['refund'], 'recipients': ['boss@example.com']},
+]
+
+
+class RouterTestCase(unittest.TestCase):
+    """
+    Unit tests for ``Router``.
+    """
+
+    def setUp(self):
+        self.router = Router(ROUTES)
+
+    def test_category(self):
+        self.assertEqual(self.router.route({'category': 'billing'}),
+                         ['billing@example.com'])
+
+    def test_subject(self):
+        self.assertEqual(self.router.route({'subject': '[BUG] it broke'}),
+                         ['dev@example.com'])
+        self.assertIsNone(self.router.route({'subject': 'a [bug]'}))
+
+    def test_keywords(self):
+        """
+        Keywords are matched as whole words in the subject and the message.
+        """
+        data = {'subject': 'Hello', 'message': 'I want a Refund now'}
+        self.assertEqual(self.router.route(data),
+                         ['billing@example.com', 'boss@example.com'])
+        self.assertIsNone(self.router.route({'message': 'refunds'}))
+
+    def test_overlapping_keywords(self):
+        """
+        Every rule matches, even when the keywords overlap.
+        """
+        router = Router([
+            {'keywords': ['refund'], 'recipients': ['a@example.com']},
+            {'keywords': ['refund request'], 'recipients': ['b@example.com']},
+            {'keywords': ['request please'], 'recipients': ['c@example.com']},
+        ])
+        self.assertEqual(router.route({'message': 'refund request please'}),
+                         ['a@example.com', 'b@example.com', 'c@example.com'])
+
+    def test_overlapping_subjects(self):
+        router = Router([
+            {'subject': 'urgent', 'recipients': ['a@example.com']},
+            {'subject': 'urgent bug', 'recipients': ['b@example.com']},
+            {'subject': 'bug', 'recipients': ['c@example.com']},
+        ])
+        self.assertEqual(router.route({'subject': 'Urgent bug!'}),
+                         ['a@example.com', 'b@example.com', 'c@example.com'])
+
+    def test_non_word_keywords(self):
+        """
+        Keywords may start or end with non-word characters.
+        """
+        router = Router([
+            {'keywords': ['c++', '.net'], 'recipients': ['a@example.com']},
+        ])
+        self.assertEqual(router.route({'message': 'I use C++ daily'}),
+                         ['a@example.com'])
+        self.assertEqual(router.route({'message': 'and .NET'}),
+                         ['a@example.com'])
+        self.assertIsNone(router.route({'message': 'c++x'}))
+
+    def test_several_rules(self):
+        data = {'subject': '[bug] wrong invoice', 'category': 'billing'}
+        self.assertEqual(self.router.route(data),
+                         ['billing@example.com', 'dev@example.com'])
+
+    def test_no_match(self):
+        self.assertIsNone(self.router.route({'subject': 'Hi', 'message': ''}))
+
+    def test_many_rules(self):
+        """
+        Patterns are split into several expressions to stay within the
+        group limit.
+        """
+        routes = [
+            {'subject': r'topic(\d+)x%d$' % i,
+             'recipients': ['%d@example.com' % i]}
+            for i in range(MAX_GROUPS + 1)
+        ]
+        router = Router(routes)
+        self.assertGreater(len(router.subject_matchers), 1)
+        for i in (0, 50, MAX_GROUPS):
+            self.assertEqual(router.route({'subject': 'topic1x%d' % i}),
+                             ['%d@example.com' % i])
+
+    def test_invalid(self):
+        with self.assertRaises(ImproperlyConfigured):
+            Router([{'subject': '('}])
+        with self.assertRaises(ImproperlyConfigured):
+            Router([{'subject': '(', 'recipients': []}])
+        with self.assertRaises(ImproperlyConfigured):
+            Router([{'recipients': ['a@example.com']}])
+
+
+class RoutedContactFormTestCase(TestCase):
+    """
+    Recipients chosen by ``ContactForm`` when routes are configured.
+    """
+
+    def setUp(self):
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Where is my invoice?',
+        }
+
+    def test_no_routes(self):
+        self.assertIsNone(get_router())
+
+    @override_settings(ENVELOPE_ROUTES=ROUTES)
+    def test_routed(self):
+        form = ContactForm(self.form_data)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_email_recipients(),
+                         ['billing@example.com'])
+        self.assertIs(get_router(), get_router())
+
+    @override_settings(ENVELOPE_ROUTES=ROUTES,
+                       ENVELOPE_EMAIL_RECIPIENTS=['default@example.com'])
+    def test_fallback(self):
+        self.form_data['message'] = 'Hello'
+        form = ContactForm(self.form_data)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(form.get_email_recipients(),
+                         ['default@example.com'])
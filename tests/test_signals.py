@@ -0,0 +1,156 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for concurrent signal dispatch.
+"""
+
+import threading
+import time
+import unittest
+
+from django.dispatch import Signal
+
+from envelope import signals
+from envelope.signals import ReceiverPool, send_concurrently
+
+
+def slow_accept(sender, **kwargs):
+    time.sleep(0.2)
+    return True
+
+
+def another_slow_accept(sender, **kwargs):
+    time.sleep(0.2)
+    return True
+
+
+def very_slow_accept(sender, **kwargs):
+    time.sleep(1)
+    return True
+
+
+def reject(sender, **kwargs):
+    return False
+
+
+def fail(sender, **kwargs):
+    raise ValueError("oops")
+
+
+class SendConcurrentlyTestCase(unittest.TestCase):
+    """
+    Unit tests for ``send_concurrently``.
+    """
+
+    def setUp(self):
+        self.signal = Signal(providing_args=['request', 'form'])
+        pool = ReceiverPool(threads=4, queue_size=10)
+        self.addCleanup(setattr, signals, '_pool', signals._pool)
+        signals._pool = pool
+
+    def send(self, timeout=5):
+        start = time.time()
+        responses = send_concurrently(self.signal, sender=None,
+                                      timeout=timeout, request=None, form=None)
+        return responses, time.time() - start
+
+    def test_parallel(self):
+        """
+        Receivers run at the same time.
+        """
+        self.signal.connect(slow_accept)
+        self.signal.connect(another_slow_accept)
+        responses, elapsed = self.send()
+        self.assertEqual(sorted(r for (receiver, r) in responses),
+                         [True, True])
+        self.assertLess(elapsed, 0.35)
+
+    def test_rejection(self):
+        """
+        The first rejection ends the dispatch.
+        """
+        self.signal.connect(very_slow_accept)
+        self.signal.connect(reject)
+        responses, elapsed = self.send()
+        self.assertEqual(responses, [(reject, False)])
+        self.assertLess(elapsed, 0.5)
+
+    def test_timeout(self):
+        """
+        Receivers that don't respond in time count as rejections.
+        """
+        self.signal.connect(very_slow_accept)
+        responses, elapsed = self.send(timeout=0.1)
+        self.assertEqual(responses, [(very_slow_accept, None)])
+        self.assertLess(elapsed, 0.5)
+
+    def test_exception(self):
+        self.signal.connect(fail)
+        with self.assertRaises(ValueError):
+            self.send()
+
+    def test_no_receivers(self):
+        self.assertEqual(self.send()[0], [])
+
+    def test_bounded_threads(self):
+        """
+        Requests share a fixed number of threads.
+        """
+        self.signal.connect(slow_accept)
+        self.signal.connect(another_slow_accept)
+        for i in range(5):
+            self.send(timeout=0.01)
+        self.assertEqual(len(signals._pool.workers), 4)
+
+    def test_skipped_after_timeout(self):
+        """
+        Receivers which haven't started when the dispatch ends aren't called.
+        """
+        calls = []
+
+        def record(sender, **kwargs):
+            calls.append(sender)
+            return True
+
+        self.signal.connect(very_slow_accept)
+        self.signal.connect(record)
+        signals._pool = ReceiverPool(threads=1, queue_size=10)
+        responses, elapsed = self.send(timeout=0.1)
+        self.assertEqual(responses,
+                         [(very_slow_accept, None), (record, None)])
+        signals._pool.join()
+        self.assertEqual(calls, [])
+
+    def test_saturated_pool(self):
+        """
+        A receiver which never gets a thread rejects the message.
+        """
+        event = threading.Event()
+        self.addCleanup(event.set)
+        signals._pool = ReceiverPool(threads=1, queue_size=10)
+        signals._pool.submit(event.wait)
+        self.signal.connect(reject)
+        responses, elapsed = self.send(timeout=0.1)
+        self.assertEqual(responses, [(reject, None)])
+
+    def test_full_queue(self):
+        """
+        Receivers are called synchronously when the queue is full.
+        """
+        started = threading.Event()
+        event = threading.Event()
+        self.addCleanup(event.set)
+
+        def block():
+            started.set()
+            event.wait()
+
+        signals._pool = ReceiverPool(threads=1, queue_size=1)
+        signals._pool.submit(block)
+        started.wait()
+        signals._pool.submit(block)
+        self.signal.connect(reject)
+        responses, elapsed = self.send()
+        self.assertEqual(responses, [(reject, False)])
@@ -15,7 +15,10 @@ try:
 except ImportError:
     honeypot = None
 
-from envelope.spam_filters import check_honeypot
+from django.test import override_settings
+
+from envelope.spam_filters import (SpamFilterPipeline, check_honeypot,
+                                   get_spam_filter_pipeline, spam_filter)
 
 
 # mocking form and request, no need to use the real things here
@@ -53,3 +56,66 @@ class CheckHoneypotTestCase(unittest.TestCase):
         """
         self.request.POST[self.honeypot] = 'Hi, this is a bot'
         self.assertFalse(check_honeypot(self.request, self.form))
+
+
+class SpamFilterPipelineTestCase(unittest.TestCase):
+    """
+    Unit tests for ``SpamFilterPipeline``.
+    """
+
+    def setUp(self):
+        self.form = FakeForm()
+        self.request = FakeRequest()
+        self.calls = []
+
+    def make_filter(self, name, result, cost=None):
+        def func(request, form):
+            self.calls.append(name)
+            return result
+        func.__name__ = name
+        if cost is not None:
+            func = spam_filter(cost=cost)(func)
+        return func
+
+    def test_cost_order(self):
+        """
+        Cheaper filters run first.
+        """
+        pipeline = SpamFilterPipeline([
+            self.make_filter('expensive', True, cost=100),
+            self.make_filter('default', True),
+            self.make_filter('cheap', True, cost=1),
+        ])
+        self.assertIsNone(pipeline.run(self.request, self.form))
+        self.assertEqual(self.calls, ['cheap', 'default', 'expensive'])
+
+    def test_short_circuit(self):
+        """
+        The pipeline stops at the first rejection.
+        """
+        reject = self.make_filter('reject', False, cost=1)
+        pipeline = SpamFilterPipeline([
+            self.make_filter('expensive', True, cost=100),
+            reject,
+        ])
+        self.assertIs(pipeline.run(self.request, self.form), reject)
+        self.assertEqual(self.calls, ['reject'])
+
+    def test_timings(self):
+        """
+        The pipeline records time spent in each filter.
+        """
+        pipeline = SpamFilterPipeline([self.make_filter('check', True)])
+        pipeline.run(self.request, self.form)
+        pipeline.run(self.request, self.form)
+        calls, total = pipeline.timings['check']
+        self.assertEqual(calls, 2)
+        self.assertGreaterEqual(total, 0)
+
+    def test_settings(self):
+        """
+        The default pipeline is built from ``ENVELOPE_SPAM_FILTERS``.
+        """
+        self.assertEqual(get_spam_filter_pipeline().filters, [check_honeypot])
+        with override_settings(ENVELOPE_SPAM_FILTERS=[]):
+            self.assertEqual(get_spam_filter_pipeline().filters, [])
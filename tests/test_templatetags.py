@@ -5,12 +5,26 @@ Unit tests for ``django-envelope`` template tags.
 
 from __future__ import unicode_literals
 
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.template import TemplateSyntaxError
 from django.template.loader import render_to_string
-from django.test import TestCase
+from django.test import TestCase, override_settings
+
+try:
+    from django.core.urlresolvers import reverse
+except ImportError:
+    from django.urls import reverse
+
+try:
+    import honeypot
+except ImportError:
+    honeypot = None
 
 from envelope.forms import ContactForm
-from envelope.templatetags.envelope_tags import render_contact_form
+from envelope.templatetags.envelope_tags import (CSRF_PLACEHOLDER,
+                                                 ContactFormNode,
+                                                 render_contact_form)
 
 
 class RenderContactFormTestCase(TestCase):
@@ -30,3 +44,36 @@ class RenderContactFormTestCase(TestCase):
         context = {'form': ContactForm()}
         content = render_to_string('envelope/contact_form.html', context)
         self.assertNotIn('&lt;div', content)
+
+
+@override_settings(ENVELOPE_FORM_CACHE_TIMEOUT=60)
+class CachedContactFormTestCase(TestCase):
+    def setUp(self):
+        self.url = reverse('envelope-contact')
+        self.addCleanup(cache.clear)
+
+    def test_cached_markup(self):
+        """
+        The form markup is cached, but the CSRF token is always fresh.
+        """
+        self.client.get(self.url)
+        key = ContactFormNode().get_cache_key(ContactForm())
+        self.assertIn(CSRF_PLACEHOLDER, cache.get(key))
+        response = self.client.get(self.url)
+        self.assertContains(response, 'name="csrfmiddlewaretoken"')
+        self.assertNotContains(response, CSRF_PLACEHOLDER)
+        self.assertNotContains(response, 'envelope:antispam_fields')
+        self.assertIn('csrftoken', response.cookies)
+        if honeypot is not None:
+            self.assertContains(response, 'name="email2"')
+
+    def test_authenticated_user(self):
+        """
+        Prefilled forms of authenticated users are not cached.
+        """
+        User.objects.create_user('test', 'test@example.org', 'password')
+        self.client.login(username='test', password='password')
+        response = self.client.get(self.url)
+        self.assertContains(response, 'value="test@example.org"')
+        key = ContactFormNode().get_cache_key(ContactForm())
+        self.assertIsNone(cache.get(key))
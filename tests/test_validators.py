@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import unicode_literals
+
+"""
+Unit tests for ``django-envelope`` validators.
+"""
+
+import socket
+import threading
+import time
+import unittest
+
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+
+from envelope import validators
+from envelope.forms import ContactForm
+from envelope.validators import (check_email_domain, lookup_domain,
+                                 validate_email_domain)
+
+try:
+    import dns.message
+    import dns.rcode
+    import dns.rdatatype
+    import dns.rrset
+except ImportError:
+    dns = None
+
+
+class ValidateEmailDomainTestCase(TestCase):
+    """
+    Unit tests for ``validate_email_domain``.
+    """
+
+    def setUp(self):
+        self.addCleanup(validators.domain_cache.clear)
+        patcher = patch('envelope.validators.lookup_domain')
+        self.lookup = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_valid_domain(self):
+        self.lookup.return_value = True
+        validate_email_domain('test@example.com')
+        self.lookup.assert_called_once_with('example.com', 2)
+
+    def test_invalid_domain(self):
+        self.lookup.return_value = False
+        with self.assertRaises(ValidationError):
+            validate_email_domain('test@nonexistent.invalid')
+
+    def test_timeout(self):
+        """
+        Addresses are accepted if the domain could not be checked.
+        """
+        self.lookup.return_value = None
+        validate_email_domain('test@slow.example.com')
+        validate_email_domain('test@slow.example.com')
+        self.assertEqual(self.lookup.call_count, 2)
+
+    def test_cache(self):
+        """
+        Positive and negative answers are cached.
+        """
+        self.lookup.return_value = True
+        self.assertTrue(check_email_domain('example.com'))
+        self.assertTrue(check_email_domain('example.com'))
+        self.lookup.return_value = False
+        self.assertFalse(check_email_domain('example.invalid'))
+        self.assertFalse(check_email_domain('example.invalid'))
+        self.assertEqual(self.lookup.call_count, 2)
+
+    def test_form(self):
+        data = {
+            'sender': 'me',
+            'email': 'test@example.invalid',
+            'message': 'Hello there!',
+        }
+        self.lookup.return_value = False
+        self.assertTrue(ContactForm(data).is_valid())
+        with override_settings(ENVELOPE_VERIFY_EMAIL_DOMAIN=True):
+            form = ContactForm(data)
+            self.assertFalse(form.is_valid())
+            self.assertIn('email', form.errors)
+
+
+class StubNameServer(object):
+    """
+    A name server on localhost answering from a dictionary.
+
+    ``zone`` maps domain names to dictionaries of record types and values,
+    or to ``'servfail'`` or ``'timeout'``. Other names don't exist.
+    """
+
+    def __init__(self, zone):
+        self.zone = zone
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.bind(('127.0.0.1', 0))
+        self.port = self.socket.getsockname()[1]
+        self.thread = threading.Thread(target=self.serve)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def serve(self):
+        while True:
+            try:
+                data, address = self.socket.recvfrom(512)
+            except (OSError, socket.error):
+                return
+            query = dns.message.from_wire(data)
+            question = query.question[0]
+            name = question.name.to_text().rstrip('.').lower()
+            entry = self.zone.get(name)
+            if entry == 'timeout':
+                continue
+            response = dns.message.make_response(query)
+            if entry == 'servfail':
+                response.set_rcode(dns.rcode.SERVFAIL)
+            elif entry is None:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            else:
+                rdtype = dns.rdatatype.to_text(question.rdtype)
+                if rdtype in entry:
+                    response.answer.append(dns.rrset.from_text(
+                        question.name, 60, 'IN', rdtype, entry[rdtype],
+                    ))
+            self.socket.sendto(response.to_wire(), address)
+
+    def close(self):
+        self.socket.close()
+
+
+@unittest.skipIf(dns is None, "dnspython is not installed")
+class LookupDomainTestCase(TestCase):
+    """
+    Unit tests for ``lookup_domain`` against a local name server.
+    """
+
+    def setUp(self):
+        server = StubNameServer({
+            'mx.example.com': {'MX': '10 mail.example.com.'},
+            'a.example.com': {'A': '192.0.2.1'},
+            'empty.example.com': {},
+            'broken.example.com': 'servfail',
+            'slow.example.com': 'timeout',
+        })
+        self.addCleanup(server.close)
+        self.addCleanup(validators.domain_cache.clear)
+        settings = override_settings(ENVELOPE_DNS_NAMESERVERS=['127.0.0.1'],
+                                     ENVELOPE_DNS_PORT=server.port)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def test_mx(self):
+        self.assertTrue(lookup_domain('mx.example.com', 2))
+
+    def test_address_only(self):
+        self.assertTrue(lookup_domain('a.example.com', 2))
+
+    def test_no_records(self):
+        self.assertFalse(lookup_domain('empty.example.com', 2))
+
+    def test_nxdomain(self):
+        self.assertFalse(lookup_domain('nonexistent.example.com', 2))
+
+    def test_servfail(self):
+        """
+        A failing name server doesn't make the domain invalid.
+        """
+        self.assertIsNone(lookup_domain('broken.example.com', 2))
+        self.assertIsNone(check_email_domain('broken.example.com'))
+        self.assertIsNone(validators.domain_cache.get('broken.example.com'))
+
+    def test_timeout(self):
+        start = time.time()
+        self.assertIsNone(lookup_domain('slow.example.com', 0.3))
+        self.assertLess(time.time() - start, 1)
+
+
+class NoDNSPythonTestCase(TestCase):
+    @patch('envelope.validators.dns', None)
+    def test_unknown(self):
+        """
+        Without dnspython, domains are never rejected.
+        """
+        self.assertIsNone(lookup_domain('example.invalid', 1))
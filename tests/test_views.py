@@ -6,24 +6,31 @@ from __future__ import unicode_literals, print_function
 Unit tests for ``django-envelope`` views.
 """
 
+import json
 import unittest
 
+try:
+    from unittest.mock import patch
+except ImportError:
+    from mock import patch
+
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core import mail
 
 try:
     from django.core.urlresolvers import reverse
 except ImportError:
     from django.urls import reverse
 
-from django.test import TestCase
+from django.test import TestCase, override_settings
 
 try:
     import honeypot
 except ImportError:
     honeypot = None
 
-from envelope import signals
+from envelope import ratelimit, signals
 
 
 class ContactViewTestCase(TestCase):
@@ -98,6 +105,19 @@ class ContactViewTestCase(TestCase):
         response = self.client.post(self.url, self.form_data, follow=True)
         self.assertEqual(response.status_code, 200)
 
+    @unittest.skipIf(honeypot is None, "django-honeypot is not installed")
+    @override_settings(ENVELOPE_PARALLEL_BEFORE_SEND=True)
+    def test_honeypot_parallel(self):
+        """
+        Spam filtering also works when receivers are called concurrently.
+        """
+        self.form_data.update({self.honeypot: 'some value'})
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 400)
+        self.form_data.update({self.honeypot: ''})
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 302)
+
     def test_form_invalid(self):
         """
         If the POST data is incorrect, the form is invalid.
@@ -164,3 +184,119 @@ class ContactViewTestCase(TestCase):
         self.form_data.update({self.honeypot: 'some value'})
         response = self.client.post(self.subclassed_url, self.form_data, follow=True)
         self.assertEqual(response.status_code, 400)
+
+    @override_settings(ENVELOPE_RATELIMIT='1/m')
+    def test_rate_limit(self):
+        """
+        Too many submissions from one client are throttled.
+        """
+        self.addCleanup(ratelimit._limiters.clear)
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 302)
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '60')
+
+
+class JSONContactViewTestCase(TestCase):
+    """
+    Unit tests for the JSON contact form views.
+    """
+
+    def setUp(self):
+        self.url = reverse('envelope-contact-json')
+        self.validate_url = reverse('envelope-contact-validate')
+        self.honeypot = getattr(settings, 'HONEYPOT_FIELD_NAME', 'email2')
+        self.form_data = {
+            'sender': 'zbyszek',
+            'email': 'test@example.com',
+            'subject': 'A subject',
+            'message': 'Hello there!',
+            self.honeypot: '',
+        }
+
+    def post_json(self, url, data):
+        return self.client.post(url, json.dumps(data),
+                                content_type='application/json')
+
+    def test_json_success(self):
+        response = self.post_json(self.url, self.form_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'success': True})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_form_encoded(self):
+        response = self.client.post(self.url, self.form_data)
+        self.assertEqual(response.json(), {'success': True})
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_invalid(self):
+        """
+        Errors are returned as JSON, without rendering any template.
+        """
+        self.form_data['email'] = 'nope'
+        del self.form_data['message']
+        response = self.post_json(self.url, self.form_data)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(set(response.json()['errors']), {'email', 'message'})
+        self.assertEqual(response.templates, [])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_malformed_json(self):
+        response = self.client.post(self.url, '{"sender": ',
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('__all__', response.json()['errors'])
+        response = self.post_json(self.url, ['a list'])
+        self.assertEqual(response.status_code, 400)
+
+    @unittest.skipIf(honeypot is None, "django-honeypot is not installed")
+    def test_spam(self):
+        """
+        Spam filters see the JSON data.
+        """
+        self.form_data[self.honeypot] = 'spam'
+        response = self.post_json(self.url, self.form_data)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('__all__', response.json()['errors'])
+        self.assertEqual(len(mail.outbox), 0)
+
+    @override_settings(ENVELOPE_RATELIMIT='1/m')
+    def test_rate_limit(self):
+        self.addCleanup(ratelimit._limiters.clear)
+        self.post_json(self.url, self.form_data)
+        response = self.post_json(self.url, self.form_data)
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.json(), {'retry_after': 60})
+
+    def test_get_not_allowed(self):
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+
+    def test_validate(self):
+        """
+        The validation endpoint never sends the message.
+        """
+        response = self.post_json(self.validate_url, self.form_data)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'errors': {}})
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_validate_field(self):
+        response = self.post_json(self.validate_url + '?field=email',
+                                  {'email': 'nope'})
+        self.assertEqual(list(response.json()['errors']), ['email'])
+        response = self.post_json(self.validate_url + '?field=email',
+                                  {'email': 'test@example.com'})
+        self.assertEqual(response.json(), {'errors': {}})
+
+    @override_settings(ENVELOPE_VERIFY_EMAIL_DOMAIN=True)
+    def test_validate_no_dns(self):
+        """
+        The unthrottled validation endpoint doesn't look up email domains.
+        """
+        with patch('envelope.forms.validate_email_domain') as validate:
+            response = self.post_json(self.validate_url, self.form_data)
+            self.assertEqual(response.json(), {'errors': {}})
+            self.assertFalse(validate.called)
+            self.post_json(self.url, self.form_data)
+            self.assertTrue(validate.called)
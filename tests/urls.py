@@ -1,6 +1,7 @@
 from django.conf.urls import include, url
+from django.contrib import admin
 
-from envelope.views import ContactView
+from envelope.views import AttachmentContactView, ContactView
 
 
 class SubclassedContactView(ContactView):
@@ -8,6 +9,7 @@ class SubclassedContactView(ContactView):
 
 
 urlpatterns = [
+    url(r'^admin/', admin.site.urls),
     url(r'', include('envelope.urls')),
     url(r'^class_contact/', ContactView.as_view(), name='class_contact'),
 
@@ -23,4 +25,7 @@ urlpatterns = [
         SubclassedContactView.as_view(),
         name='subclassed_class_contact'
     ),
+
+    url(r'^attachment_contact/', AttachmentContactView.as_view(),
+        name='attachment_contact'),
 ]